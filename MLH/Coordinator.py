@@ -0,0 +1,134 @@
+"""
+Coordinator mode: split a plant selection between several bots working in the same garden and run their loops concurrently.
+Only available through the API, the device handles of the other bots must be registered with register_bot before the run
+"""
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+from farmware_tools import device
+
+from Farmbot import Farmware, Plant, _get_device
+from RunLog import log
+
+# device handles by serial number, the bot running the farmware is registered automatically
+__bots: Dict[str, Any] = {}
+
+
+def register_bot(serial_number: str, bot: Any):
+    """
+    Register the device handle of another bot, it must provide the farmware_tools device functions (see Farmware.bind)
+    """
+    __bots[serial_number] = bot
+
+
+def unregister_bot(serial_number: str):
+    __bots.pop(serial_number, None)
+
+
+def get_bots() -> Dict[str, Any]:
+    bots = dict(__bots)
+    bots.setdefault(_get_device()['serial_number'], device)
+    return bots
+
+
+def partition(plants: Iterable[Plant], regions: Dict[str, List[int]], meta_key: Optional[str] = None) -> Dict[str, List[Plant]]:
+    """
+    Assign the plants to bots: by the serial number stored in the meta_key of the plant if present,
+    otherwise by the region [x_min, y_min, x_max, y_max] containing the plant, otherwise to the region with the nearest center.
+    """
+    result: Dict[str, List[Plant]] = {serial: [] for serial in regions}
+    for plant in plants:
+        serial = plant.meta.get(meta_key) if meta_key else None
+        if serial not in result:
+            serial = None
+            best_dist = None
+            for candidate, (x_min, y_min, x_max, y_max) in regions.items():
+                if x_min <= plant.x <= x_max and y_min <= plant.y <= y_max:
+                    serial = candidate
+                    break
+                dist = plant.distance((x_min + x_max) / 2, (y_min + y_max) / 2)
+                if best_dist is None or dist < best_dist:
+                    serial, best_dist = candidate, dist
+        result[serial].append(plant)
+    return result
+
+
+class BotReport(object):
+    __slots__ = ('serial_number', 'planned', 'completed', 'seconds', 'error')
+
+    serial_number: str
+    planned: int
+    completed: int
+    seconds: float
+    error: Optional[str]
+
+    def __init__(self, serial_number: str, planned: int):
+        self.serial_number = serial_number
+        self.planned = planned
+        self.completed = 0
+        self.seconds = 0.0
+        self.error = None
+
+    def __str__(self):
+        return f"{self.serial_number}: {self.completed}/{self.planned} plants in {self.seconds:.0f}s" + (f", failed: {self.error}" if self.error else '')
+
+
+TFarmware = TypeVar("TFarmware", bound=Farmware)
+# loop(bound farmware, plants, done callback) runs the routine on one bot, calling done for every completed plant
+Loop = Callable[[TFarmware, List[Plant], Callable[[Plant], None]], Any]
+
+
+def run_partitions(farmware: TFarmware, partitions: Dict[str, List[Plant]], loop: Loop, done: Callable[[Plant], None]) -> List[BotReport]:
+    """
+    Run the loop for every non-empty partition concurrently, each on a copy of the farmware bound to its bot.
+    The done callback is always invoked on the calling thread, so results and meta updates are merged centrally.
+    Raises a ValueError before anything is run if a partition has no registered bot, and after the run if any bot failed.
+    """
+    bots = get_bots()
+    missing = sorted(serial for serial, plants in partitions.items() if plants and serial not in bots)
+    if missing:
+        raise ValueError(f"No device registered for bots {', '.join(missing)}, register them with Coordinator.register_bot")
+    reports: List[BotReport] = []
+    completed: queue.Queue = queue.Queue()
+
+    simulators = []
+
+    def run(report: BotReport, plants: List[Plant]):
+        started = time.monotonic()
+        try:
+            bound = farmware.bind(bots[report.serial_number])
+            if bound.simulator:
+                simulators.append(bound.simulator)
+            loop(bound, plants, lambda plant: completed.put((report, plant)))
+        except Exception as ex:
+            report.error = str(ex)
+        finally:
+            report.seconds = time.monotonic() - started
+
+    jobs = []
+    for serial, plants in partitions.items():
+        if not plants:
+            continue
+        report = BotReport(serial, len(plants))
+        reports.append(report)
+        jobs.append((report, plants))
+    if jobs:
+        with ThreadPoolExecutor(len(jobs)) as pool:
+            futures = [pool.submit(run, report, plants) for report, plants in jobs]
+            while not (all(future.done() for future in futures) and completed.empty()):
+                try:
+                    report, plant = completed.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                report.completed += 1
+                done(plant)
+    if farmware.simulator:
+        farmware.simulator.merge_concurrent(simulators)
+    for report in reports:
+        log(f"Bot {report}", 'error' if report.error else 'info')
+    failed = [report.serial_number for report in reports if report.error]
+    if failed:
+        raise ValueError(f"Coordinated run failed on bots {', '.join(failed)}")
+    return reports
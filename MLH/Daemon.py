@@ -0,0 +1,99 @@
+"""
+Optional resident worker which keeps the interpreter, entity factories, API caches and HTTP sessions warm between farmware runs.
+
+Start it with `python main.py daemon`; subsequent `main.py` invocations forward their run to it over a Unix socket
+and fall back to in-process execution when it is not running.
+"""
+import json
+import os
+import socket
+import socketserver
+import sys
+from typing import *
+
+SOCKET_PATH = os.environ.get('MLH_DAEMON_SOCKET', '/tmp/mlh-daemon.sock')
+CACHE_SECONDS = float(os.environ.get('MLH_DAEMON_CACHE_SECONDS', '300'))
+# maximum duration of a forwarded run
+RUN_TIMEOUT = float(os.environ.get('MLH_DAEMON_RUN_TIMEOUT', '3600'))
+
+Runner = Callable[[List[str]], int]
+
+
+def forward(argv: List[str], env: Dict[str, str], path: str = SOCKET_PATH, connect_timeout: float = 5.0, run_timeout: float = RUN_TIMEOUT) -> Optional[int]:
+    """
+    Forward a run to the daemon and return its exit code, or None if no daemon is listening.
+    Once the daemon accepted the run it is never re-run in-process: a lost connection is reported as a failure (exit code 1).
+    """
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(connect_timeout)
+        try:
+            sock.connect(path)
+        except OSError:
+            return None
+        try:
+            sock.settimeout(run_timeout)
+            with sock.makefile('rwb') as stream:
+                stream.write(json.dumps({'argv': argv, 'env': env}).encode('utf-8') + b'\n')
+                stream.flush()
+                line = stream.readline()
+            if not line:
+                raise ConnectionResetError("the daemon closed the connection")
+            return int(json.loads(line.decode('utf-8'))['exit_code'])
+        except (OSError, ValueError, KeyError) as ex:
+            print(f"Lost the connection to the MLH daemon during the run: {str(ex) or type(ex).__name__}", file=sys.stderr)
+            return 1
+    finally:
+        sock.close()
+
+
+class _RunHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        exit_code = self.server.run(request['argv'], request['env'])
+        self.wfile.write(json.dumps({'exit_code': exit_code}).encode('utf-8') + b'\n')
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """
+    Serves one run at a time, with the environment of the forwarding process swapped in for the duration of the run
+    """
+    runner: Runner
+    cache_seconds: float
+
+    def __init__(self, runner: Runner, path: str = SOCKET_PATH, cache_seconds: float = CACHE_SECONDS):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _RunHandler)
+        self.runner = runner
+        self.cache_seconds = cache_seconds
+
+    def run(self, argv: List[str], env: Dict[str, str]) -> int:
+        from Farmbot import _expire_caches
+        _expire_caches(self.cache_seconds)
+        saved = dict(os.environ)
+        os.environ.clear()
+        os.environ.update(env)
+        try:
+            return self.runner(argv)
+        except SystemExit as ex:
+            return ex.code if isinstance(ex.code, int) else 1
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def serve(runner: Runner, path: str = SOCKET_PATH):
+    """Run the daemon until interrupted"""
+    with DaemonServer(runner, path) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
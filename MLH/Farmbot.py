@@ -1,16 +1,23 @@
 import ast
+import base64
+import copy
 import os
-import requests
 import math
 import time
-import urllib.parse
 import re
 import OpenFarm
+import HttpClient
+import Snapshot
+import Motion
+import Simulator
+import SequenceAnalysis
+import Metrics
 import operator
 import json
 from abc import abstractmethod
 from farmware_tools import device, app
-from datetime import *
+from RunLog import log
+from datetime import datetime, date, timedelta
 from typing import *
 from utils import utc_now, get_factory, Entity, parse_datetime, dump_datetime, parse_offset, TAny, literal_eval_checked
 
@@ -162,7 +169,7 @@ class Point(Identifiable, Coordinate):
                 del data[key]
             else:
                 data[key] = value
-        device.log(f"Applied data update to point: {json.dumps(self)}", "debug")
+        log(lambda: f"Applied data update to point: {json.dumps(self)}", "debug")
 
 
 class Plant(Point):
@@ -268,6 +275,73 @@ def __create_identifiable(endpoint: str, typ: Type[TIdentifiable]) -> Dict[Union
     return result
 
 
+__cache_loaded_at: Dict[str, float] = {}
+
+
+def _api_request(method: str, endpoint: str, id: Optional[int] = None, payload: Any = None) -> Any:
+    """
+    Send a request to the web app through the shared HTTP client, which bounds it by timeouts and retries (farmware_tools.app waits forever).
+    Raises requests.exceptions.HTTPError for an error response.
+    """
+    token = os.environ.get('FARMBOT_API_TOKEN') or os.environ.get('API_TOKEN')
+    if not token:
+        raise ValueError("The web app API token is not available (FARMBOT_API_TOKEN)")
+    claims = token.split('.')[1]
+    server = json.loads(base64.urlsafe_b64decode(claims + '=' * (-len(claims) % 4)))['iss']
+    url = f"http{'s' if ':443' in server else ''}:{server}/api/{endpoint}" + (f"/{id}" if id is not None else '')
+    response = HttpClient.get_client().request(method, url, json=payload, headers={'Authorization': f'Bearer {token}'})
+    response.raise_for_status()
+    return response.json()
+
+
+def _expire_caches(max_age: float):
+    """
+    Drop the cached API data (device, sequences, tools, crops) which was loaded more than max_age seconds ago
+    """
+    global __device, __sequences, __tools, __crops, __motion_model
+    now = time.monotonic()
+    expired = {key for key, loaded_at in __cache_loaded_at.items() if now - loaded_at > max_age}
+    if 'device' in expired:
+        __device = None
+    if 'sequences' in expired:
+        __sequences = None
+        SequenceAnalysis.clear()
+    if 'tools' in expired:
+        __tools = None
+    if 'crops' in expired:
+        __crops = {}
+    if 'firmware_config' in expired:
+        __motion_model = None
+    for key in expired:
+        del __cache_loaded_at[key]
+
+
+__device: Optional[Dict[str, Any]] = None
+
+
+def _get_device(force_refresh: bool = False) -> Dict[str, Any]:
+    global __device
+    if force_refresh or __device is None:
+        __device = app.get('device')
+        __cache_loaded_at['device'] = time.monotonic()
+    return __device
+
+
+__motion_model: Optional[Motion.MotionModel] = None
+
+
+def _get_motion_model(force_refresh: bool = False) -> Motion.MotionModel:
+    global __motion_model
+    if force_refresh or __motion_model is None:
+        try:
+            __motion_model = Motion.MotionModel.from_firmware_config(app.get('firmware_config'))
+        except Exception as ex:
+            log(f"Could not load firmware config, using default motion model: {str(ex)}", 'debug')
+            __motion_model = Motion.MotionModel.default()
+        __cache_loaded_at['firmware_config'] = time.monotonic()
+    return __motion_model
+
+
 __sequences: Optional[Dict[Union[str, int], Sequence]] = None
 
 
@@ -275,6 +349,7 @@ def _get_sequences(force_refresh: bool = False) -> Dict[str, Sequence]:
     global __sequences
     if force_refresh or __sequences is None:
         __sequences = __create_identifiable('sequences', Sequence)
+        __cache_loaded_at['sequences'] = time.monotonic()
     return __sequences
 
 
@@ -285,12 +360,46 @@ def _get_tools(force_refresh: bool = False) -> Dict[str, Tool]:
     global __tools
     if force_refresh or __tools is None:
         __tools = __create_identifiable('tools', Tool)
+        __cache_loaded_at['tools'] = time.monotonic()
     return __tools
 
 
+__crops: Dict[str, OpenFarm.Crop] = {}
+
+
+def _get_crop(slug: str, force_refresh: bool = False) -> OpenFarm.Crop:
+    crop = None if force_refresh else __crops.get(slug)
+    Metrics.current().count('cache_miss' if crop is None else 'cache_hit')
+    if crop is None:
+        response = HttpClient.get_client().get('https://openfarm.cc/api/v1/crops', params={
+            'include': 'pictures',
+            'filter': slug
+        })
+        response.raise_for_status()
+        for data in response.json()["data"]:
+            if data["type"] == "crops" and data["attributes"]["slug"] == slug:
+                crop = deserialize(OpenFarm.Crop, data)
+                break
+        else:
+            raise ValueError(f'Crop `{slug}` not found.')
+        __cache_loaded_at.setdefault('crops', time.monotonic())
+        __crops[slug] = crop
+    return crop
+
+
 TPoint = TypeVar("TPoint", bound=Point)
 
 
+def _compare(value: Any, parse: Callable[[Any], Any], op: Callable[[Any, Any], bool], bound: Any) -> bool:
+    """Compare a point value against a bound; a missing or unparseable value does not match"""
+    if value is None:
+        return False
+    try:
+        return op(parse(value), bound)
+    except (TypeError, ValueError):
+        return False
+
+
 class PointQuery(Generic[TPoint]):
     __rxdate = re.compile('(?:(before|after)\\s+)?([0-9]+\\s[a-z]+\\s+ago|in\\s+[0-9]+\\s+[a-z]+|now|20[1-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]:[0-9][0-9]:[0-9][0-9](?:\\.[0-9]+)Z)')
     __rxnum = re.compile('at\\s+(least|most)\\s+(-?[0-9]+(?:\\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)')
@@ -302,6 +411,7 @@ class PointQuery(Generic[TPoint]):
     def __init__(self, point_type: Type[TPoint], query: Union[str, Dict[str, Any]]):
         factory = get_factory(point_type)
         props: List[str] = factory.__self__.get_props()
+        self.factory = factory
         if isinstance(query, str):
             query = literal_eval_checked(query, dict)
         self.predicates = []
@@ -316,7 +426,7 @@ class PointQuery(Generic[TPoint]):
             else:
                 negate = False
             ismeta = (key in ('meta', 'id')) or (key not in props)
-            get = (lambda v, key=key: v['meta'][key]) if ismeta else (lambda v, key=key: v[key])
+            get = (lambda v, key=key: v.meta.get(key)) if ismeta else (lambda v, key=key: getattr(v, key))
             if isinstance(value, str):
                 # special date handling
                 match = PointQuery.__rxdate.fullmatch(value.strip())
@@ -326,21 +436,15 @@ class PointQuery(Generic[TPoint]):
                         # exact date match, no local filtering required, but normalize the date format
                         value = dump_datetime(date)
                     else:
-                        if match.group(1) == 'before':
-                            op = operator.lt if not negate else operator.ge
-                        else:  # match.group(1) == 'after':
-                            op = operator.gt if not negate else operator.le
-                        self.predicates.append(lambda v, get=get, op=op, date=date: op(parse_datetime(get(v)), date))
+                        op = operator.lt if match.group(1) == 'before' else operator.gt
+                        self.predicates.append(lambda v, get=get, op=op, date=date, negate=negate: _compare(get(v), parse_datetime, op, date) != negate)
                         continue
                 # special number handling
                 match = PointQuery.__rxnum.fullmatch(value.strip())
                 if match:
                     number = float(match.group(2))
-                    if match.group(1) == 'least':
-                        op = operator.ge if not negate else operator.lt
-                    else:  # match.group(1) == 'most':
-                        op = operator.le if not negate else operator.gt
-                    self.predicates.append(lambda v, get=get, op=op, number=number: op(float(get(v)), number))
+                    op = operator.ge if match.group(1) == 'least' else operator.le
+                    self.predicates.append(lambda v, get=get, op=op, number=number, negate=negate: _compare(get(v), float, op, number) != negate)
                     continue
             if negate:
                 self.predicates.append(lambda v, get=get, value=value: get(v) != value)
@@ -350,15 +454,14 @@ class PointQuery(Generic[TPoint]):
                 self.filter[key] = value
         if not self.filter['meta']:
             del self.filter['meta']
-        device.log(f"Built remote filter {json.dumps(self.filter)} and {len(self.predicates)} local predicates", message_type='debug')
+        log(lambda: f"Built remote filter {json.dumps(self.filter)} and {len(self.predicates)} local predicates", 'debug')
 
-    def execute(self) -> List[TPoint]:
+    def execute(self, snapshot: Optional[Snapshot.GardenSnapshot] = None) -> List[TPoint]:
         result: List[TPoint] = []
-        for point in (self.factory(data) for data in app.search_points(self.filter)):
-            for predicate in self.predicates:
-                if not predicate(point):
-                    continue
-            result.append(point)
+        rows = snapshot.search(self.filter) if snapshot else app.search_points(self.filter)
+        for point in (self.factory(data) for data in rows):
+            if all(predicate(point) for predicate in self.predicates):
+                result.append(point)
         return result
 
 
@@ -369,7 +472,7 @@ def deserialize(typ: Type[TAny], data: Any) -> TAny:
     try:
         return get_factory(typ)(data)
     except Exception as ex:
-        device.log(f"Failed to deserialize {typ.__name__} from data {json.dumps(data)}")
+        log(lambda: f"Failed to deserialize {typ.__name__} from data {json.dumps(data)}", 'error')
         raise ex
 
 
@@ -377,12 +480,16 @@ class Farmware(Generic[TConfig]):
     config: TConfig
     debug: bool
     app_name: str
+    device: Any
+    simulator: Optional[Simulator.Simulator]
 
     def __init__(self, config_type: Type[TConfig], manifest_name: Optional[str]):
         self.debug = False
         self.local = False
+        self.device = device
+        self._snapshot = None
         self.app_name = manifest_name or type(self).__name__
-        device.log(f"Initializing farmware {type(self).__name__} with manifest name {self.app_name}", "debug")
+        log(f"Initializing farmware {type(self).__name__} with manifest name {self.app_name}", "debug")
         rx = re.compile(f"^{re.escape(self.app_name.replace('-', '_'))}_([a-z_]+)$", re.IGNORECASE)
         config = {}
         for env in os.environ.items():
@@ -392,30 +499,44 @@ class Farmware(Generic[TConfig]):
                 if name == 'action':
                     if env[1].lower() != 'real':
                         self.debug = True
-                        device.log('TEST MODE, NO sequences or movement will be run, plants will NOT be updated', 'warn')
+                        log('TEST MODE, NO sequences or movement will be run, plants will NOT be updated', 'warn')
                 else:
                     config[name] = env[1]
-        device.log(f"Farmware raw config: {json.dumps(config)}", 'debug')
+        self.simulator = Simulator.Simulator() if self.debug else None
+        log(lambda: f"Farmware raw config: {json.dumps(config)}", 'debug')
         try:
             self.config = deserialize(config_type, config)
         except Exception as e:
             raise ValueError('Error getting farmware config: ' + str(e))
         import utils
-        utils.tz = int(app.get('device')['tz_offset_hrs'])
+        utils.tz = int(_get_device()['tz_offset_hrs'])
 
     @abstractmethod
     def execute(self):
         pass
 
+    def bind(self, bot: Any) -> 'Farmware[TConfig]':
+        """
+        Get a copy of this farmware which sends its movements, sequences and state queries to another bot.
+        The bot must provide the farmware_tools device functions move_absolute, move_relative, execute, sync and get_bot_state.
+        """
+        result = copy.copy(self)
+        result.device = bot
+        if self.simulator:
+            result.simulator = Simulator.Simulator()
+        return result
+
     def sync(self):
+        started = time.monotonic()
         if not self.debug:
             time.sleep(1)  # wait a bit for previously send requests to settle
-            device.sync()
+            self.device.sync()
         sync: str
         for cnt in range(1, 30):
             sync = self.bot_state().informational_settings.sync_status
-            device.log(f"interim status {sync}")
+            log(f"interim status {sync}", 'debug')
             if sync == "synced":
+                Metrics.current().add('sync', time.monotonic() - started)
                 break
             if sync == "sync_error":
                 raise ValueError('Sync error, bot failed to complete syncing')
@@ -425,7 +546,27 @@ class Farmware(Generic[TConfig]):
 
     def bot_state(self) -> BotStateTree:
         """Get the device state."""
-        return deserialize(BotStateTree, device.get_bot_state())
+        with Metrics.current().timed('api'):
+            state = self.device.get_bot_state()
+        return deserialize(BotStateTree, state)
+
+    def position(self) -> Coordinate:
+        """Get the head position, which is virtual in test mode once the simulation moved the head"""
+        if self.simulator and self.simulator.position is not None:
+            return self.simulator.position
+        return self.bot_state().location_data.position
+
+    def snapshot(self) -> Optional[Snapshot.GardenSnapshot]:
+        """Get the local garden snapshot, refreshed once per run, or None if snapshots are not enabled (MLH_SNAPSHOT_PATH)"""
+        if self._snapshot is None and Snapshot.snapshot_path():
+            self._snapshot = Snapshot.GardenSnapshot()
+            with Metrics.current().timed('api'):
+                points = app.get('points')
+            added, updated, removed = self._snapshot.refresh(points)
+            Metrics.current().count('cache_hit', len(points) - added - updated)
+            Metrics.current().count('cache_miss', added + updated)
+            log(f"Garden snapshot refreshed: {added} added, {updated} updated, {removed} removed", 'debug')
+        return self._snapshot
 
     def sequences(self) -> List[Sequence]:
         """Get the available sequences."""
@@ -471,12 +612,22 @@ class Farmware(Generic[TConfig]):
         """
         Store an existing or new point
         """
-        device.log(f"Sending point {json.dumps(point)}", 'debug')
+        log(lambda: f"Sending point {json.dumps(point)}", 'debug')
         if self.debug:
+            self.simulator.api_calls += 1
             return point
-        result = app.put('points', point.id, point) if point.id is not None else app.post('points', cast(Any, point))
+        result = self.send_point(point)
+        if self._snapshot is not None:
+            self._snapshot.put(result)
         return deserialize(Point, result)
 
+    def send_point(self, point: Union[Entity, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Create or update a point in the web app and return the stored point, without updating the snapshot (safe to call from worker threads)
+        """
+        data = point.__dict__ if isinstance(point, Entity) else point
+        return _api_request('PUT', 'points', data['id'], data) if data.get('id') is not None else _api_request('POST', 'points', payload=data)
+
     def add_plant(self, x: float, y: float, **kwargs) -> Plant:
         """Add a plant to the garden map.
 
@@ -512,16 +663,7 @@ class Farmware(Generic[TConfig]):
         Args:
             plant (Plant | str): Plant | plant slug.
         """
-        slug = plant.openfarm_slug if plant is Plant else plant
-        response = requests.get('https://openfarm.cc/api/v1/crops?' + urllib.parse.urlencode({
-            'include': 'pictures',
-            'filter': slug
-        }))
-        response.raise_for_status()
-        for data in response.json()["data"]:
-            if data["type"] == "crops" and data["attributes"]["slug"] == slug:
-                return deserialize(OpenFarm.Crop, data)
-        raise ValueError(f'Crop `{slug}` not found.')
+        return _get_crop(plant.openfarm_slug if isinstance(plant, Plant) else plant)
 
     def moveto_smart(self, target: Union[Coordinate, Tool, Dict[str, int]], speed: int = 100, offset_x: int = 0, offset_y: int = 0, offset_z: int = 0, travel_height: Optional[int] = 0,
                      proximity_range: int = 20) -> Coordinate:
@@ -529,47 +671,81 @@ class Farmware(Generic[TConfig]):
         Perform a smart movement to the given point.
         :returns The previous position
         """
-        position = self.bot_state().location_data.position
-        if not self.debug:
-            if isinstance(target, Tool):
-                target = self.get_toolslots(tool_id=target.id)[0]
-            if not isinstance(target, Coordinate):
-                target = position.merge(target)
-            if (travel_height is not None) and (travel_height > position.z or travel_height > target.z) and (
-                    abs(position.x - target.x) > proximity_range or abs(position.y - target.y) > proximity_range):
-                # travel height must be respected
-                if target.z + offset_z > travel_height:
-                    travel_height = target.z + offset_z
-                device.move_relative(0, 0, travel_height - position.z, speed)
-                device.move_absolute(target.merge({'z': travel_height}).to_coordinate(), speed, device.assemble_coordinate(offset_x, offset_y, 0))
-                if abs((target.z + offset_z) - travel_height) <= 2:
-                    return position
-            device.move_absolute(target.to_coordinate(), speed, device.assemble_coordinate(offset_x, offset_y, offset_z))
+        position = self.position()
+        if isinstance(target, Tool):
+            target = self.get_toolslots(tool_id=target.id)[0]
+        if not isinstance(target, Coordinate):
+            target = position.merge(target)
+        model = _get_motion_model()
+        destination = target + Coordinate(x=offset_x, y=offset_y, z=offset_z)
+        hop = model.needs_hop(position, target, travel_height, proximity_range)
+        estimated = model.smart_move_time(position, destination, travel_height, proximity_range, speed, hop)
+        if self.debug:
+            self.simulator.move(position, destination, estimated, max(travel_height, destination.z) if hop else None)
+            Metrics.current().add('move', estimated)
+            return position
+        started = time.monotonic()
+        if hop:
+            # travel height must be respected
+            if target.z + offset_z > travel_height:
+                travel_height = target.z + offset_z
+            self.device.move_relative(0, 0, travel_height - position.z, speed)
+            self.device.move_absolute(target.merge({'z': travel_height}).to_coordinate(), speed, device.assemble_coordinate(offset_x, offset_y, 0))
+            if abs((target.z + offset_z) - travel_height) > 2:
+                self.device.move_absolute(target.to_coordinate(), speed, device.assemble_coordinate(offset_x, offset_y, offset_z))
+        else:
+            self.device.move_absolute(target.to_coordinate(), speed, device.assemble_coordinate(offset_x, offset_y, offset_z))
+        actual = time.monotonic() - started
+        Metrics.current().add('move', actual)
+        log(f"Moved to ({destination.x}, {destination.y}, {destination.z}): estimated {estimated:.1f}s, actual {actual:.1f}s", 'debug')
         return position
 
     def query_points(self, typ: Type[TPoint], query: Union[str, Dict[str, Any]]) -> List[TPoint]:
-        return PointQuery(typ, query).execute()
+        return PointQuery(typ, query).execute(self.snapshot())
 
     def execute_sequence(self, sequence: Union[Sequence, str, int, None]):
         if sequence is not None:
             if not isinstance(sequence, Sequence):
                 sequence = _get_sequences()[sequence]
-            device.log(F"Executing sequence {sequence.name}")
-            if not self.debug:
-                device.execute(sequence.id)
+            info = self.analyze_sequence(sequence)
+            if info.is_noop:
+                log(F"Skipping sequence {sequence.name}, it has no effect", 'debug')
+                return
+            log(F"Executing sequence {sequence.name}")
+            if self.debug:
+                self.simulator.run_sequence(info.estimated_seconds)
+                Metrics.current().add('sequence', info.estimated_seconds)
+            else:
+                with Metrics.current().timed('sequence'):
+                    self.device.execute(sequence.id)
 
-    def sort_moves(self, targets: Iterable[Coordinate]) -> Iterator[Coordinate]:
+    def analyze_sequence(self, sequence: Union[Sequence, str, int]) -> SequenceAnalysis.SequenceInfo:
+        """Get the flattened analysis of a sequence (cached until the sequence is updated)"""
+        if not isinstance(sequence, Sequence):
+            sequence = _get_sequences()[sequence]
+        return SequenceAnalysis.analyze(sequence, lambda id: _get_sequences().get(id), _get_motion_model())
+
+    def sort_moves(self, targets: Iterable[Coordinate], offset_x: int = 0, offset_y: int = 0, offset_z: int = 0, travel_height: Optional[int] = None,
+                   proximity_range: int = 20, speed: int = 100) -> Iterator[Coordinate]:
+        """
+        Order the targets greedily by the estimated travel time of the smart move from the previous target.
+        """
         targets = list(targets)
+        if not targets:
+            return
+        model = _get_motion_model()
+        offset = Coordinate(x=offset_x, y=offset_y, z=offset_z)
+        curr_coord = self.position()
         while len(targets) > 0:
-            curr_coord = get_factory(BotStateTree)(device.get_bot_state()).location_data.position
-            best_dist: float = math.inf
-            best_coord: Optional[Coordinate] = None
+            best_time: float = math.inf
             best_ix: Optional[int] = None
             for ix in range(len(targets)):
-                dist = targets[ix].distance(curr_coord.x, curr_coord.y)
-                if dist < best_dist:
-                    best_dist = dist
-                    best_coord = targets[ix]
+                # same hop decision as moveto_smart, which compares the head position with the target without offsets
+                hop = model.needs_hop(curr_coord, targets[ix], travel_height, proximity_range)
+                cost = model.smart_move_time(curr_coord, targets[ix] + offset, travel_height, proximity_range, speed, hop)
+                if cost < best_time:
+                    best_time = cost
                     best_ix = ix
-            del targets[best_ix]
+            best_coord = targets.pop(best_ix)
+            curr_coord = best_coord + offset
             yield best_coord
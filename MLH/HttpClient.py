@@ -0,0 +1,146 @@
+import time
+import urllib.parse
+from typing import *
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# methods which can safely be sent again when the server may already have processed them
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+
+def _not_sent(ex: requests.exceptions.RequestException) -> bool:
+    """Whether the request failed while connecting, i.e. before anything was sent"""
+    if isinstance(ex, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(ex.args[0], 'reason', None) if ex.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+class HostMetrics(object):
+    """Latency statistics for the requests sent to one host"""
+    __slots__ = ('host', 'count', 'errors', 'retries', 'total_seconds', 'max_seconds', 'latencies')
+
+    host: str
+    count: int
+    errors: int
+    retries: int
+    total_seconds: float
+    max_seconds: float
+    latencies: List[float]
+
+    def __init__(self, host: str):
+        self.host = host
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.latencies = []
+
+    def record(self, seconds: float, error: bool):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total_seconds += seconds
+        self.latencies.append(seconds)
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def __str__(self):
+        avg = self.total_seconds / self.count if self.count else 0.0
+        return f"{self.host}: {self.count} requests, {self.errors} errors, {self.retries} retries, avg {avg * 1000:.0f} ms, max {self.max_seconds * 1000:.0f} ms"
+
+
+class HttpClient(object):
+    """
+    Shared HTTP client for outbound calls, with pooled keep-alive sessions per host, timeouts and bounded retries
+    """
+    connect_timeout: float
+    read_timeout: float
+    retries: int
+    backoff: float
+    gzip: bool
+    pool_size: int
+    metrics: Dict[str, HostMetrics]
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 30.0, retries: int = 3, backoff: float = 0.5, gzip: bool = True, pool_size: int = 4):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.gzip = gzip
+        self.pool_size = pool_size
+        self.metrics = {}
+        self.__sessions: Dict[str, requests.Session] = {}
+
+    def session(self, host: str) -> requests.Session:
+        """Get the pooled session for a host (scheme://netloc)"""
+        session = self.__sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate' if self.gzip else 'identity'
+            self.__sessions[host] = session
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying with exponential backoff on connection errors, timeouts and 5xx responses.
+        Non-idempotent requests (POST, PATCH) are only retried when the connection could not be established.
+        The last response is returned as-is (the caller decides whether to raise_for_status), the last exception is re-raised.
+        """
+        parts = urllib.parse.urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        metrics = self.metrics.get(host)
+        if metrics is None:
+            metrics = self.metrics[host] = HostMetrics(host)
+        session = self.session(host)
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                metrics.record(time.monotonic() - started, True)
+                if attempt >= self.retries or not (idempotent or _not_sent(ex)):
+                    raise
+            else:
+                metrics.record(time.monotonic() - started, response.status_code >= 500)
+                if response.status_code < 500 or attempt >= self.retries or not idempotent:
+                    return response
+                response.close()
+            metrics.retries += 1
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request('GET', url, params=params, **kwargs)
+
+    def post(self, url: str, json: Any = None, **kwargs) -> requests.Response:
+        return self.request('POST', url, json=json, **kwargs)
+
+    def summary(self) -> str:
+        """Get a one-line-per-host latency summary"""
+        return '\n'.join(str(metrics) for metrics in self.metrics.values())
+
+    def close(self):
+        for session in self.__sessions.values():
+            session.close()
+        self.__sessions.clear()
+
+
+__client: Optional[HttpClient] = None
+
+
+def get_client() -> HttpClient:
+    """Get the shared HTTP client"""
+    global __client
+    if __client is None:
+        __client = HttpClient()
+    return __client
@@ -0,0 +1,145 @@
+import csv
+import math
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+from Farmbot import Farmware, Plant
+from utils import Entity
+from RunLog import log
+
+
+class Config(Entity):
+    pattern: Optional[str]
+    csv: Optional[str]
+    origin_x: Optional[int]
+    origin_y: Optional[int]
+    columns: Optional[int]
+    rows: Optional[int]
+    spacing_x: Optional[int]
+    spacing_y: Optional[int]
+    name: Optional[str]
+    openfarm_slug: Optional[str]
+    plant_stage: Optional[str]
+    planted_at: Optional[datetime]
+    meta: Optional[Dict[str, Any]]
+    tolerance: Optional[int]
+    concurrency: Optional[int]
+
+
+def grid(origin_x: float, origin_y: float, columns: int, rows: int, spacing_x: float, spacing_y: float) -> List[Dict[str, Any]]:
+    """Rectangular grid, row by row"""
+    return [{'x': origin_x + col * spacing_x, 'y': origin_y + row * spacing_y} for row in range(rows) for col in range(columns)]
+
+
+def hex_grid(origin_x: float, origin_y: float, columns: int, rows: int, spacing: float) -> List[Dict[str, Any]]:
+    """Hexagonal packing: every other row is shifted by half the spacing, rows are spacing*sqrt(3)/2 apart"""
+    row_spacing = spacing * math.sqrt(3) / 2
+    return [{'x': round(origin_x + col * spacing + (spacing / 2 if row % 2 else 0)), 'y': round(origin_y + row * row_spacing)}
+            for row in range(rows) for col in range(columns)]
+
+
+def row(origin_x: float, origin_y: float, count: int, step_x: float, step_y: float) -> List[Dict[str, Any]]:
+    """Single row of plants along the (step_x, step_y) vector"""
+    return [{'x': origin_x + ix * step_x, 'y': origin_y + ix * step_y} for ix in range(count)]
+
+
+def read_csv(path: str) -> List[Dict[str, Any]]:
+    """Read plant rows from a CSV file with a header; x and y are required, other columns are passed on as plant properties"""
+    result: List[Dict[str, Any]] = []
+    with open(path, newline='') as file:
+        for data in csv.DictReader(file):
+            data = {key.strip(): value.strip() for key, value in data.items() if key and value not in (None, '')}
+            data['x'] = float(data['x'])
+            data['y'] = float(data['y'])
+            result.append(data)
+    return result
+
+
+def find_duplicates(rows: List[Dict[str, Any]], existing: Iterable[Plant], tolerance: float) -> Dict[int, Optional[int]]:
+    """
+    Find the rows which have an existing plant (or an earlier row) within the tolerance.
+    :returns The existing plant id by row index (None for duplicates within the rows)
+    """
+    cells: Dict[Tuple[int, int], List[Tuple[float, float, Optional[int]]]] = {}
+    size = max(tolerance, 1)
+
+    def find(x: float, y: float) -> Optional[Tuple[float, float, Optional[int]]]:
+        cx, cy = int(x // size), int(y // size)
+        for key in ((cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+            for item in cells.get(key, ()):
+                if (item[0] - x) ** 2 + (item[1] - y) ** 2 <= tolerance ** 2:
+                    return item
+        return None
+
+    def add(x: float, y: float, id: Optional[int]):
+        cells.setdefault((int(x // size), int(y // size)), []).append((x, y, id))
+
+    for plant in existing:
+        add(plant.x, plant.y, plant.id)
+    result: Dict[int, Optional[int]] = {}
+    for ix, data in enumerate(rows):
+        item = find(data['x'], data['y'])
+        if item:
+            result[ix] = item[2]
+        else:
+            add(data['x'], data['y'], None)
+    return result
+
+
+class Layout(Farmware[Config]):
+    def __init__(self, app_name: str):
+        super().__init__(Config, app_name)
+
+    def execute(self):
+        config = self.config
+        if config.csv:
+            rows = read_csv(config.csv)
+        elif config.pattern:
+            origin_x, origin_y = config.origin_x or 0, config.origin_y or 0
+            columns, spacing_x = config.columns or 1, config.spacing_x or 100
+            if config.pattern == 'grid':
+                rows = grid(origin_x, origin_y, columns, config.rows or 1, spacing_x, config.spacing_y or spacing_x)
+            elif config.pattern == 'hex':
+                rows = hex_grid(origin_x, origin_y, columns, config.rows or 1, spacing_x)
+            elif config.pattern == 'row':
+                rows = row(origin_x, origin_y, columns, spacing_x, config.spacing_y or 0)
+            else:
+                raise ValueError(f"Unknown layout pattern '{config.pattern}', expected grid, hex or row")
+        else:
+            raise ValueError("Either a CSV file or a layout pattern is required")
+        defaults = {key: getattr(config, key) for key in ('name', 'openfarm_slug', 'plant_stage', 'planted_at', 'meta') if getattr(config, key) is not None}
+        ids = self.add_plants([{**defaults, **data} for data in rows], config.tolerance or 0, config.concurrency or 4)
+        log(f"Layout done: {sum(1 for id in ids.values() if id is not None)} of {len(rows)} rows mapped to plants", 'info')
+
+    def add_plants(self, rows: List[Dict[str, Any]], tolerance: float = 0, concurrency: int = 4, progress_every: int = 20) -> Dict[int, Optional[int]]:
+        """
+        Create many plants at once, skipping rows with an existing plant within the tolerance (in mm).
+        :returns The created or existing plant id by input row index (None if the creation failed or the row duplicates an earlier row)
+        """
+        result: Dict[int, Optional[int]] = find_duplicates(rows, self.query_points(Plant, {}), tolerance) if tolerance else {}
+        if result:
+            log(f"Skipping {len(result)} rows with an existing plant within {tolerance} mm", 'info')
+        pending = [(ix, data) for ix, data in enumerate(rows) if ix not in result]
+        done = 0
+
+        def create(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            payload = {'pointer_type': 'Plant', **{key: value for key, value in data.items() if value is not None}}
+            if self.debug:
+                return None
+            try:
+                return self.send_point(payload)
+            except Exception as ex:
+                log(f"Failed to create plant at ({data['x']}, {data['y']}): {str(ex)}", 'error')
+                return None
+
+        with ThreadPoolExecutor(max(concurrency, 1)) as pool:
+            for ix, point in zip((ix for ix, _ in pending), pool.map(create, (data for _, data in pending))):
+                result[ix] = None if point is None else point['id']
+                # the snapshot connection belongs to this thread
+                if point is not None and self._snapshot is not None:
+                    self._snapshot.put(point)
+                done += 1
+                if done % progress_every == 0 or done == len(pending):
+                    log(f"Created {done}/{len(pending)} plants", 'info')
+        return result
@@ -1,11 +1,15 @@
 import ast
 import datetime
+import time
 from typing import *
 
-from farmware_tools import device
+from RunLog import log
 
 from Farmbot import Farmware, Plant, Sequence
 from utils import parse_datetime, parse_date, dump_datetime, dump_date, local_to_utc, utc_to_local, utc_now, local_now, Entity
+import Coordinator
+import Metrics
+import Watering
 
 
 class Config(Entity):
@@ -18,21 +22,52 @@ class Config(Entity):
     end: Optional[Sequence]
     offset_x: Optional[int]
     offset_y: Optional[int]
+    bots: Optional[Dict[str, List[int]]]
+    bot_meta_key: Optional[str]
 
 
 class MLH(Farmware[Config]):
+    skipped: Dict[str, int]
+
     def __init__(self, app_name: str):
         super().__init__(Config, app_name)
+        self.skipped = {}
 
     def execute(self):
         plants = self.query_points(Plant, self.config.query)
         if not plants:
-            device.log(f"The query did not yield any plants, skipping execution", 'info')
+            log(f"The query did not yield any plants, skipping execution", 'info')
             return
+        if Watering.is_iwatering(self.config.after):
+            plants, self.skipped = Watering.prefilter(self, plants)
+            Metrics.current().count('skipped', sum(self.skipped.values()))
+            for reason, count in self.skipped.items():
+                log(f"iWatering skips {count} plants: {reason}", 'info')
+            if not plants:
+                log("iWatering skips all plants, skipping execution", 'info')
+                return
+        if self.config.bots:
+            partitions = Coordinator.partition(plants, self.config.bots, self.config.bot_meta_key)
+            Coordinator.run_partitions(self, partitions, MLH.run_plants, self.save_plant)
+        else:
+            self.run_plants(plants, self.save_plant)
+
+    def run_plants(self, plants: List[Plant], done: Callable[[Plant], None]):
+        # cycles of a test run take the simulated time
+        clock = (lambda: self.simulator.seconds) if self.simulator else time.monotonic
         self.execute_sequence(self.config.init)
-        for plant in self.sort_moves(plants):
+        for plant in self.sort_moves(plants, self.config.offset_x or 0, self.config.offset_y or 0, 0, self.config.travel_height):
+            started = clock()
             self.execute_sequence(self.config.before)
             self.moveto_smart(plant, 100, self.config.offset_x or 0, self.config.offset_y or 0, 0, self.config.travel_height)
             self.execute_sequence(self.config.after)
-            # TODO: update metadata
+            Metrics.current().add('cycle', clock() - started)
+            Metrics.current().count('plants')
+            done(plant)
         self.execute_sequence(self.config.end)
+
+    def save_plant(self, plant: Plant):
+        """Update the metadata of a plant which has been processed"""
+        if self.config.save_meta:
+            plant.apply(self.config.save_meta)
+            self.put_point(plant)
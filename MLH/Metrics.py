@@ -0,0 +1,226 @@
+"""
+Run-level metrics: each farmware run appends a compact record to a local rolling SQLite store, which `python main.py report` summarizes
+"""
+import json
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import *
+
+if TYPE_CHECKING:
+    from Simulator import Simulator
+
+# kept next to the farmware, since the temp directory of the bot does not survive a reboot and the history must span days
+DEFAULT_METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mlh-metrics.sqlite')
+# number of runs kept in the store
+MAX_RUNS = 2000
+# a metric is flagged when it exceeds the median of the previous runs by this factor
+REGRESSION_FACTOR = 1.25
+
+
+def metrics_path() -> str:
+    """Path of the store (MLH_METRICS_PATH, empty to disable), read on every call so daemon runs use their forwarded environment"""
+    return os.environ.get('MLH_METRICS_PATH', DEFAULT_METRICS_PATH)
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class RunMetrics(object):
+    """
+    Timing samples (cycle, move, sequence, sync, api) and counters (plants, skipped, cache_hit, cache_miss) of one run;
+    in test runs the cycle, move and sequence samples are simulated durations
+    """
+    app: str
+    test: bool
+    started: float
+    started_at: datetime
+    samples: Dict[str, List[float]]
+    counters: Dict[str, int]
+
+    def __init__(self, app: str, test: bool = False):
+        self.app = app
+        self.test = test
+        self.started = time.monotonic()
+        self.started_at = datetime.utcnow()
+        self.samples = {}
+        self.counters = {}
+        self.__lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self.__lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def count(self, name: str, count: int = 1):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    @contextmanager
+    def timed(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def record(self, success: bool, simulator: Optional['Simulator'] = None) -> Dict[str, Any]:
+        """Compact summary of the run, with the simulated durations of a test run taken from its simulator"""
+        result: Dict[str, Any] = {
+            'app': self.app,
+            'started_at': self.started_at.isoformat(timespec='seconds') + 'Z',
+            'success': success,
+            'test': self.test,
+            'seconds': round(time.monotonic() - self.started, 3),
+        }
+        for name, values in self.samples.items():
+            result[f'{name}_count'] = len(values)
+            result[f'{name}_total'] = round(sum(values), 3)
+            result[f'{name}_p50'] = round(percentile(values, 0.5), 3)
+            result[f'{name}_p95'] = round(percentile(values, 0.95), 3)
+        if simulator is not None:
+            # the simulator merged concurrent bots by their slowest one, the samples are summed over all bots
+            result['seconds'] = round(simulator.seconds, 3)
+            result['move_total'] = round(simulator.move_seconds, 3)
+            result['sequence_total'] = round(simulator.sequence_seconds, 3)
+        result.update(self.counters)
+        lookups = self.counters.get('cache_hit', 0) + self.counters.get('cache_miss', 0)
+        if lookups:
+            result['cache_hit_rate'] = round(self.counters.get('cache_hit', 0) / lookups, 3)
+        return result
+
+
+__current = RunMetrics('')
+
+
+def start(app: str, test: bool = False) -> RunMetrics:
+    """Start collecting the metrics of a new run"""
+    global __current
+    __current = RunMetrics(app, test)
+    return __current
+
+
+def current() -> RunMetrics:
+    return __current
+
+
+class MetricsStore(object):
+    path: str
+    connection: sqlite3.Connection
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = metrics_path() if path is None else path
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT NOT NULL,
+                app TEXT NOT NULL,
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS runs_app ON runs (app, id);
+        ''')
+
+    def close(self):
+        self.connection.close()
+
+    def append(self, record: Dict[str, Any]):
+        with self.connection:
+            self.connection.execute('INSERT INTO runs (started_at, app, record) VALUES (?, ?, ?)', (record['started_at'], record['app'], json.dumps(record)))
+            self.connection.execute('DELETE FROM runs WHERE id <= (SELECT MAX(id) FROM runs) - ?', (MAX_RUNS,))
+
+    def runs(self, app: Optional[str] = None, limit: int = 30) -> List[Dict[str, Any]]:
+        """The last runs, oldest first"""
+        if app:
+            rows = self.connection.execute('SELECT record FROM runs WHERE app = ? ORDER BY id DESC LIMIT ?', (app, limit))
+        else:
+            rows = self.connection.execute('SELECT record FROM runs ORDER BY id DESC LIMIT ?', (limit,))
+        return [json.loads(text) for (text,) in rows][::-1]
+
+    def apps(self) -> List[str]:
+        return [app for (app,) in self.connection.execute('SELECT DISTINCT app FROM runs ORDER BY app')]
+
+
+def finish(success: bool, api_latencies: Iterable[float] = (), simulator: Optional['Simulator'] = None, path: Optional[str] = None) -> Dict[str, Any]:
+    """Store the record of the current run"""
+    if path is None:
+        path = metrics_path()
+    metrics = current()
+    for seconds in api_latencies:
+        metrics.add('api', seconds)
+    record = metrics.record(success, simulator)
+    if path:
+        store = MetricsStore(path)
+        try:
+            store.append(record)
+        finally:
+            store.close()
+    return record
+
+
+# (metric, label, format) shown in the report, all of them are checked for regressions
+REPORT_COLUMNS: List[Tuple[str, str, str]] = [
+    ('seconds', 'run s', '{:.0f}'),
+    ('plants', 'plants', '{:.0f}'),
+    ('skipped', 'skipped', '{:.0f}'),
+    ('cycle_p50', 'cycle s', '{:.1f}'),
+    ('move_total', 'move s', '{:.0f}'),
+    ('sequence_total', 'seq s', '{:.0f}'),
+    ('sync_total', 'sync s', '{:.1f}'),
+    ('api_p50', 'api p50', '{:.2f}'),
+    ('api_p95', 'api p95', '{:.2f}'),
+    ('cache_hit_rate', 'cache', '{:.0%}'),
+]
+# metrics where an increase is not a regression
+NEUTRAL_METRICS = frozenset(('plants', 'skipped', 'cache_hit_rate'))
+
+
+def regressions(runs: List[Dict[str, Any]]) -> List[str]:
+    """Compare the last run against the median of the previous ones of the same kind (test runs are only compared with test runs)"""
+    if len(runs) < 2:
+        return []
+    latest = runs[-1]
+    previous = [run for run in runs[:-1] if bool(run.get('test')) == bool(latest.get('test'))]
+    result: List[str] = []
+    for metric, label, fmt in REPORT_COLUMNS:
+        if metric in NEUTRAL_METRICS or latest.get(metric) is None:
+            continue
+        values = [run[metric] for run in previous if run.get(metric) is not None]
+        if not values:
+            continue
+        baseline = statistics.median(values)
+        if baseline > 0 and latest[metric] > baseline * REGRESSION_FACTOR:
+            result.append(f"{label} {fmt.format(latest[metric])} vs median {fmt.format(baseline)}")
+    return result
+
+
+def report(app: Optional[str] = None, limit: int = 30, path: Optional[str] = None) -> str:
+    """Text report of the recent runs per app with flagged regressions"""
+    if path is None:
+        path = metrics_path()
+    if not os.path.exists(path):
+        return f"No metrics recorded yet ({path})"
+    store = MetricsStore(path)
+    try:
+        lines: List[str] = []
+        for name in ([app] if app else store.apps()):
+            runs = store.runs(name, limit)
+            if not runs:
+                continue
+            lines.append(f"== {name or '(unknown)'}: last {len(runs)} runs")
+            lines.append('  '.join(['started (UTC)       ', 'ok', 'mode'] + [f"{label:>8}" for _, label, _ in REPORT_COLUMNS]))
+            for run in runs:
+                cells = [f"{fmt.format(run[metric]):>8}" if run.get(metric) is not None else f"{'-':>8}" for metric, _, fmt in REPORT_COLUMNS]
+                lines.append('  '.join([f"{run['started_at']:<20}", 'ok' if run.get('success') else '!!', 'test' if run.get('test') else 'live'] + cells))
+            for regression in regressions(runs):
+                lines.append(f"  REGRESSION: {regression}")
+        return '\n'.join(lines)
+    finally:
+        store.close()
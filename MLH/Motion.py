@@ -0,0 +1,94 @@
+"""
+Kinematic travel-time model of the gantry, used to rank moves and estimate run durations
+"""
+import math
+from typing import *
+
+if TYPE_CHECKING:
+    from Farmbot import Coordinate
+
+
+class AxisProfile(object):
+    """Trapezoidal velocity profile of one axis, in mm/s and mm/s²"""
+    __slots__ = ('speed', 'acceleration')
+
+    speed: float
+    acceleration: float
+
+    def __init__(self, speed: float, acceleration: float):
+        self.speed = speed
+        self.acceleration = acceleration
+
+    def time(self, distance: float, speed: int = 100) -> float:
+        """Time in seconds to travel the distance from standstill to standstill at the given speed percentage"""
+        distance = abs(distance)
+        if not distance:
+            return 0.0
+        v = self.speed * speed / 100
+        a = self.acceleration
+        if distance >= v * v / a:  # reaches full speed
+            return distance / v + v / a
+        return 2 * math.sqrt(distance / a)
+
+    def __repr__(self):
+        return f"AxisProfile({self.speed}, {self.acceleration})"
+
+
+class MotionModel(object):
+    """
+    The axes move concurrently, so the duration of a move is the time of its slowest axis
+    """
+    __slots__ = ('x', 'y', 'z')
+
+    x: AxisProfile
+    y: AxisProfile
+    z: AxisProfile
+
+    def __init__(self, x: AxisProfile, y: AxisProfile, z: AxisProfile):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    @classmethod
+    def default(cls) -> 'MotionModel':
+        """Defaults of the FarmBot Genesis firmware"""
+        return cls(AxisProfile(80, 53), AxisProfile(80, 53), AxisProfile(40, 40))
+
+    @classmethod
+    def from_firmware_config(cls, config: Dict[str, Any]) -> 'MotionModel':
+        """Build the model from the web app firmware_config (speeds in steps/s, acceleration distances in steps)"""
+        default = cls.default()
+
+        def axis(name: str) -> AxisProfile:
+            try:
+                steps_per_mm = float(config[f'movement_step_per_mm_{name}'])
+                speed = float(config[f'movement_max_spd_{name}']) / steps_per_mm
+                ramp = float(config[f'movement_steps_acc_dec_{name}']) / steps_per_mm
+                return AxisProfile(speed, speed * speed / (2 * ramp))
+            except (KeyError, TypeError, ValueError, ZeroDivisionError):
+                return getattr(default, name)
+
+        return cls(axis('x'), axis('y'), axis('z'))
+
+    def move_time(self, start: 'Coordinate', end: 'Coordinate', speed: int = 100) -> float:
+        """Time in seconds for a direct move"""
+        return max(self.x.time(end.x - start.x, speed), self.y.time(end.y - start.y, speed), self.z.time(end.z - start.z, speed))
+
+    @staticmethod
+    def needs_hop(start: 'Coordinate', end: 'Coordinate', travel_height: Optional[int], proximity_range: int = 20) -> bool:
+        """Whether the move must be done by raising to the travel height, traversing and lowering"""
+        return (travel_height is not None) and (travel_height > start.z or travel_height > end.z) and (
+                abs(start.x - end.x) > proximity_range or abs(start.y - end.y) > proximity_range)
+
+    def smart_move_time(self, start: 'Coordinate', end: 'Coordinate', travel_height: Optional[int], proximity_range: int = 20, speed: int = 100,
+                        hop: Optional[bool] = None) -> float:
+        """Time in seconds for the move performed by Farmware.moveto_smart (end includes the offsets, hop is the hop decision if already taken)"""
+        if hop is None:
+            hop = self.needs_hop(start, end, travel_height, proximity_range)
+        if not hop:
+            return self.move_time(start, end, speed)
+        travel_height = max(travel_height, end.z)
+        result = self.z.time(travel_height - start.z, speed) + max(self.x.time(end.x - start.x, speed), self.y.time(end.y - start.y, speed))
+        if abs(end.z - travel_height) > 2:
+            result += self.z.time(end.z - travel_height, speed)
+        return result
@@ -0,0 +1,111 @@
+"""
+Buffered logging to the bot: the level is checked before a message is built, low-priority messages are batched into
+periodic summaries, warnings and errors are sent immediately. Optionally all messages are also written as JSON lines to a local file.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import *
+
+from farmware_tools import device
+
+LEVELS: Dict[str, int] = {'debug': 0, 'info': 1, 'busy': 1, 'fun': 1, 'success': 1, 'warn': 2, 'error': 3}
+
+Message = Union[str, Callable[[], str]]
+
+
+class RunLog(object):
+    """
+    Messages below flush_level are buffered (at most capacity) and sent as one summary every interval seconds
+    """
+    level: int
+    flush_level: int
+    capacity: int
+    interval: float
+    json_path: Optional[str]
+
+    def __init__(self, level: str = 'info', flush_level: str = 'warn', capacity: int = 50, interval: float = 30.0, json_path: Optional[str] = None):
+        self.level = LEVELS[level]
+        self.flush_level = LEVELS[flush_level]
+        self.capacity = capacity
+        self.interval = interval
+        self.json_path = json_path
+        self.__buffer: Deque[str] = deque(maxlen=capacity)
+        self.__dropped = 0
+        self.__flushed_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def enabled(self, message_type: str) -> bool:
+        """Whether a message of this type is sent to the bot or written to the JSON file"""
+        return LEVELS.get(message_type, 1) >= self.level or bool(self.json_path)
+
+    def log(self, message: Message, message_type: str = 'info'):
+        """Log a message, which may be a callable building the message only when it is going to be used"""
+        if not self.enabled(message_type):
+            return
+        priority = LEVELS.get(message_type, 1)
+        send = priority >= self.level
+        if callable(message):
+            message = message()
+        if self.json_path:
+            with self.__lock, open(self.json_path, 'a') as file:
+                file.write(json.dumps({'time': time.time(), 'type': message_type, 'message': message}) + '\n')
+        if not send:
+            return
+        if priority >= self.flush_level:
+            self.flush()
+            device.log(message, message_type)
+            return
+        with self.__lock:
+            if len(self.__buffer) == self.capacity:
+                self.__dropped += 1
+            self.__buffer.append(message)
+            due = time.monotonic() - self.__flushed_at >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Send the buffered messages as one summary"""
+        with self.__lock:
+            messages = list(self.__buffer)
+            dropped = self.__dropped
+            self.__buffer.clear()
+            self.__dropped = 0
+            self.__flushed_at = time.monotonic()
+        if len(messages) == 1 and not dropped:
+            device.log(messages[0], 'info')
+        elif messages:
+            device.log('\n'.join(messages) + (f"\n({dropped} earlier messages dropped)" if dropped else ''), 'info')
+
+
+def _from_environ() -> RunLog:
+    return RunLog(os.environ.get('MLH_LOG_LEVEL', 'info').lower(), json_path=os.environ.get('MLH_LOG_FILE') or None)
+
+
+__log = _from_environ()
+
+
+def configure() -> RunLog:
+    """Flush the current log and replace it by one configured from the environment (MLH_LOG_LEVEL, MLH_LOG_FILE) of the run"""
+    global __log
+    __log.flush()
+    __log = _from_environ()
+    return __log
+
+
+def get_log() -> RunLog:
+    return __log
+
+
+def log(message: Message, message_type: str = 'info'):
+    __log.log(message, message_type)
+
+
+def flush():
+    __log.flush()
+
+
+atexit.register(flush)
@@ -0,0 +1,126 @@
+"""
+Static analysis of sequence bodies: nested execute commands are resolved once into a flattened command list, cached per version of the sequence and its nested sequences
+"""
+from typing import *
+
+import Metrics
+import Motion
+from Simulator import COMMAND_SECONDS
+
+if TYPE_CHECKING:
+    from Farmbot import Command, Sequence
+
+MOVE_KINDS = frozenset(('move_absolute', 'move_relative', 'move', 'find_home', 'home', 'calibrate', 'zero'))
+# commands without any effect on the bot (a zero wait still costs a round trip, but does nothing)
+NOOP_KINDS = frozenset(('wait',))
+
+
+def _tool_ids(value: Any) -> Iterator[int]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == 'tool_id' and item:
+                yield item
+            else:
+                yield from _tool_ids(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _tool_ids(item)
+
+
+class SequenceInfo(object):
+    """
+    Flattened view of a sequence and its nested sequences
+    """
+    __slots__ = ('sequence_id', 'commands', 'calls', 'versions', 'recursive', 'wait_seconds', 'move_seconds', 'moves', 'tool_ids')
+
+    sequence_id: int
+    commands: List['Command']
+    calls: List[int]
+    versions: Dict[int, Any]
+    recursive: bool
+    wait_seconds: float
+    move_seconds: float
+    moves: int
+    tool_ids: Set[int]
+
+    def __init__(self, sequence_id: int):
+        self.sequence_id = sequence_id
+        self.commands = []
+        self.calls = []
+        self.versions = {}
+        self.recursive = False
+        self.wait_seconds = 0.0
+        self.move_seconds = 0.0
+        self.moves = 0
+        self.tool_ids = set()
+
+    @property
+    def is_noop(self) -> bool:
+        """Whether executing the sequence has no effect at all"""
+        return not self.recursive and all(command.kind in NOOP_KINDS and not (command.args or {}).get('milliseconds') for command in self.commands)
+
+    @property
+    def estimated_seconds(self) -> float:
+        """Estimated duration; absolute moves are only counted as commands since their start position is unknown"""
+        return len(self.commands) * COMMAND_SECONDS + self.wait_seconds + self.move_seconds
+
+    def __str__(self):
+        return (f"{len(self.commands)} commands, {len(self.calls)} nested sequences, {self.moves} moves, {self.wait_seconds:.1f}s waiting, "
+                f"tools {sorted(self.tool_ids)}, ~{self.estimated_seconds:.1f}s" + (", recursive" if self.recursive else ""))
+
+
+__cache: Dict[Tuple[int, Any], SequenceInfo] = {}
+
+
+def analyze(sequence: 'Sequence', resolve: Callable[[int], Optional['Sequence']], model: Optional[Motion.MotionModel] = None) -> SequenceInfo:
+    """
+    Analyze a sequence, resolving nested sequences by id; the result is cached until the sequence or one of its nested sequences is updated
+    """
+    key = (sequence.id, sequence.updated_at)
+    info = __cache.get(key)
+    if info is not None and not _is_current(info, resolve):
+        info = None
+    Metrics.current().count('cache_miss' if info is None else 'cache_hit')
+    if info is None:
+        info = SequenceInfo(sequence.id)
+        _flatten(sequence, resolve, model or Motion.MotionModel.default(), info, {sequence.id})
+        __cache[key] = info
+    return info
+
+
+def clear():
+    """Drop all cached analyses"""
+    __cache.clear()
+
+
+def _is_current(info: SequenceInfo, resolve: Callable[[int], Optional['Sequence']]) -> bool:
+    for sequence_id, updated_at in info.versions.items():
+        nested = resolve(sequence_id)
+        if (nested.updated_at if nested else None) != updated_at:
+            return False
+    return True
+
+
+def _flatten(sequence: 'Sequence', resolve: Callable[[int], Optional['Sequence']], model: Motion.MotionModel, info: SequenceInfo, visiting: Set[int]):
+    for command in sequence.body or []:
+        args = command.args or {}
+        if command.kind == 'execute':
+            nested = resolve(args.get('sequence_id'))
+            info.versions[args.get('sequence_id')] = nested.updated_at if nested else None
+            if nested is None:
+                info.commands.append(command)  # unknown sequence, keep the command as-is
+            elif nested.id in visiting:
+                info.recursive = True
+            else:
+                info.calls.append(nested.id)
+                _flatten(nested, resolve, model, info, visiting | {nested.id})
+            continue
+        info.commands.append(command)
+        if command.kind == 'wait':
+            info.wait_seconds += (args.get('milliseconds') or 0) / 1000
+        elif command.kind in MOVE_KINDS:
+            info.moves += 1
+            if command.kind == 'move_relative':
+                speed = args.get('speed') or 100
+                info.move_seconds += max(model.x.time(args.get('x') or 0, speed), model.y.time(args.get('y') or 0, speed), model.z.time(args.get('z') or 0, speed))
+        info.tool_ids.update(_tool_ids(args))
@@ -0,0 +1,72 @@
+"""
+Dry-run simulation of a farmware run in test mode, estimating its duration from the motion model and the sequence bodies
+"""
+import math
+from typing import *
+
+if TYPE_CHECKING:
+    from Farmbot import Coordinate
+
+# round trip and firmware overhead of a single command sent to the bot
+COMMAND_SECONDS = 0.5
+
+
+class Simulator(object):
+    """
+    Virtual head position and accumulated estimates of a test run
+    """
+    position: Optional['Coordinate']
+    move_seconds: float
+    sequence_seconds: float
+    distance: float
+    moves: int
+    sequences: int
+    api_calls: int
+
+    def __init__(self):
+        self.position = None
+        self.move_seconds = 0.0
+        self.sequence_seconds = 0.0
+        self.distance = 0.0
+        self.moves = 0
+        self.sequences = 0
+        self.api_calls = 0
+
+    @property
+    def seconds(self) -> float:
+        return self.move_seconds + self.sequence_seconds
+
+    def move(self, start: 'Coordinate', end: 'Coordinate', seconds: float, travel_height: Optional[int] = None):
+        """Advance the head, via the travel height if given"""
+        if travel_height is None:
+            self.distance += math.sqrt((end.x - start.x) ** 2 + (end.y - start.y) ** 2 + (end.z - start.z) ** 2)
+            self.api_calls += 1
+        else:
+            self.distance += abs(travel_height - start.z) + math.sqrt((end.x - start.x) ** 2 + (end.y - start.y) ** 2) + abs(end.z - travel_height)
+            self.api_calls += 2 if abs(end.z - travel_height) <= 2 else 3
+        self.move_seconds += seconds
+        self.moves += 1
+        self.position = end
+
+    def run_sequence(self, seconds: float):
+        self.sequence_seconds += seconds
+        self.sequences += 1
+        self.api_calls += 1
+
+    def merge_concurrent(self, others: Iterable['Simulator']):
+        """Add the estimates of simulations which ran concurrently (the slowest one determines the duration)"""
+        others = list(others)
+        if not others:
+            return
+        slowest = max(others, key=lambda other: other.seconds)
+        self.move_seconds += slowest.move_seconds
+        self.sequence_seconds += slowest.sequence_seconds
+        for other in others:
+            self.distance += other.distance
+            self.moves += other.moves
+            self.sequences += other.sequences
+            self.api_calls += other.api_calls
+
+    def summary(self) -> str:
+        return (f"Simulated run: {self.seconds / 60:.1f} min estimated ({self.move_seconds:.0f}s moving, {self.sequence_seconds:.0f}s in sequences), "
+                f"{self.distance / 1000:.1f} m travelled in {self.moves} moves, {self.sequences} sequences, {self.api_calls} API calls")
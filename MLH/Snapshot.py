@@ -0,0 +1,115 @@
+"""
+Local SQLite snapshot of the garden points, refreshed incrementally so that point queries do not need to deserialize the whole garden on every run
+"""
+import json
+import os
+import sqlite3
+from typing import *
+
+from farmware_tools import app
+
+
+def snapshot_path() -> str:
+    """
+    The snapshot database (MLH_SNAPSHOT_PATH), resolved per run since the daemon swaps the environment.
+    Snapshots are opt-in: a refresh downloads all points, which costs more than a filtered search for a single run.
+    """
+    return os.environ.get('MLH_SNAPSHOT_PATH', '')
+
+
+# point properties stored in indexed columns, all other properties are matched on the decoded point
+INDEXED_COLUMNS = ('pointer_type', 'name', 'plant_stage', 'openfarm_slug')
+
+
+class GardenSnapshot(object):
+    """
+    Points keyed by id with their updated_at, plus an indexed (key, value) table for meta data
+    """
+    path: str
+    connection: sqlite3.Connection
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = snapshot_path() if path is None else path
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(f'''
+            CREATE TABLE IF NOT EXISTS points (
+                id INTEGER PRIMARY KEY,
+                updated_at TEXT,
+                {', '.join(f'{column} TEXT' for column in INDEXED_COLUMNS)},
+                data TEXT NOT NULL
+            );
+            {' '.join(f'CREATE INDEX IF NOT EXISTS points_{column} ON points ({column});' for column in INDEXED_COLUMNS)}
+            CREATE TABLE IF NOT EXISTS point_meta (
+                point_id INTEGER NOT NULL REFERENCES points (id) ON DELETE CASCADE,
+                key TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (point_id, key)
+            );
+            CREATE INDEX IF NOT EXISTS point_meta_key_value ON point_meta (key, value);
+        ''')
+
+    def close(self):
+        self.connection.close()
+
+    def refresh(self, points: Optional[List[Dict[str, Any]]] = None) -> Tuple[int, int, int]:
+        """
+        Fetch the points (unless given) and apply the ones whose updated_at changed.
+        :returns The number of added, updated and removed points
+        """
+        if points is None:
+            points = app.get('points')
+        known = dict(self.connection.execute('SELECT id, updated_at FROM points'))
+        added = updated = 0
+        with self.connection:
+            for data in points:
+                updated_at = known.pop(data['id'], False)
+                if updated_at is False:
+                    added += 1
+                elif updated_at != data.get('updated_at'):
+                    updated += 1
+                else:
+                    continue
+                self.__store(data)
+            self.connection.executemany('DELETE FROM point_meta WHERE point_id = ?', ((id,) for id in known))
+            self.connection.executemany('DELETE FROM points WHERE id = ?', ((id,) for id in known))
+        return added, updated, len(known)
+
+    def put(self, data: Dict[str, Any]):
+        """Store a single point, e.g. after it has been sent to the web app"""
+        with self.connection:
+            self.__store(data)
+
+    def __store(self, data: Dict[str, Any]):
+        id = data['id']
+        self.connection.execute(f'INSERT OR REPLACE INTO points (id, updated_at, {", ".join(INDEXED_COLUMNS)}, data) VALUES (?, ?, {", ".join("?" for _ in INDEXED_COLUMNS)}, ?)',
+                                (id, data.get('updated_at'), *(data.get(column) for column in INDEXED_COLUMNS), json.dumps(data)))
+        self.connection.execute('DELETE FROM point_meta WHERE point_id = ?', (id,))
+        self.connection.executemany('INSERT INTO point_meta (point_id, key, value) VALUES (?, ?, ?)',
+                                    ((id, key, json.dumps(value)) for key, value in (data.get('meta') or {}).items()))
+
+    def search(self, filter: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Search points with the same filter semantics as app.search_points: all properties must be equal, meta is matched by key
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        residual: Dict[str, Any] = {}
+        for key, value in filter.items():
+            if key == 'meta':
+                for meta_key, meta_value in value.items():
+                    clauses.append('id IN (SELECT point_id FROM point_meta WHERE key = ? AND value = ?)')
+                    params.extend((meta_key, json.dumps(meta_value)))
+            elif key in INDEXED_COLUMNS and isinstance(value, str):
+                clauses.append(f'{key} = ?')
+                params.append(value)
+            else:
+                residual[key] = value
+        sql = 'SELECT data FROM points'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        result: List[Dict[str, Any]] = []
+        for (text,) in self.connection.execute(sql, params):
+            data = json.loads(text)
+            if all(data.get(key) == value for key, value in residual.items()):
+                result.append(data)
+        return result
@@ -0,0 +1,79 @@
+"""
+iWatering skip rules, evaluated for the whole plant selection before any route is planned
+"""
+from datetime import *
+from typing import *
+
+from Farmbot import Farmware, Plant, Sequence
+from Weather import HourlyWeather, load_weather
+from utils import parse_date, parse_datetime, utc_to_local, utc_now, local_now
+
+# (days ago, rain in mm above which watering is unnecessary, reason)
+RAIN_LIMITS: List[Tuple[int, float, str]] = [(0, 1.0, 'rain today'), (1, 10.0, 'rain yesterday'), (2, 20.0, 'rain 2 days ago')]
+
+
+def is_iwatering(sequence: Optional[Sequence]) -> bool:
+    """iWatering is engaged by an AFTER sequence with 'water' and 'mlh' in its name"""
+    if sequence is None or not sequence.name:
+        return False
+    name = sequence.name.lower()
+    return 'water' in name and 'mlh' in name
+
+
+def daily_rain(weather: Dict[str, HourlyWeather], now: Optional[datetime] = None) -> Dict[date, float]:
+    """Sum the hourly rain per local day, up to now (UTC) so that forecast hours are not counted"""
+    now = now or utc_now()
+    result: Dict[date, float] = {}
+    for instant, hour in weather.items():
+        if hour.rain:
+            instant = parse_datetime(instant)
+            if instant > now:
+                continue
+            day = utc_to_local(instant).date()
+            result[day] = result.get(day, 0.0) + hour.rain
+    return result
+
+
+def rain_skip_reason(rain: Dict[date, float], today: date) -> Optional[str]:
+    for days, limit, reason in RAIN_LIMITS:
+        if rain.get(today - timedelta(days=days), 0.0) > limit:
+            return reason
+    return None
+
+
+def _local_day(value: Any) -> Optional[date]:
+    try:
+        if isinstance(value, str) and len(value) == 10:
+            return parse_date(value)
+        return utc_to_local(parse_datetime(value)).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def plant_skip_reason(plant: Plant, today: date) -> Optional[str]:
+    if _local_day(plant.meta.get('last_watering')) == today:
+        return "already watered today"
+    if _local_day(plant.meta.get('iwatering')) == today:
+        return "already handled by iWatering today"
+    return None
+
+
+def prefilter(farmware: Farmware, plants: List[Plant]) -> Tuple[List[Plant], Dict[str, int]]:
+    """
+    Split off the plants which iWatering would not water.
+    :returns The plants to visit and the number of skipped plants per reason
+    """
+    today = local_now().date()
+    skipped: Dict[str, int] = {}
+    reason = rain_skip_reason(daily_rain(load_weather(farmware)), today)
+    if reason:
+        skipped[reason] = len(plants)
+        return [], skipped
+    result: List[Plant] = []
+    for plant in plants:
+        reason = plant_skip_reason(plant, today)
+        if reason:
+            skipped[reason] = skipped.get(reason, 0) + 1
+        else:
+            result.append(plant)
+    return result, skipped
@@ -1,11 +1,18 @@
+import csv
 import datetime
-import itertools
+import json
+import math
+import os
+import threading
+import time
+from array import array
 from abc import abstractmethod
 
 from Farmbot import *
 from typing import *
-from utils import Entity, dump_datetime, parse_datetime
-from farmware_tools import app
+from utils import Entity, dump_datetime, parse_datetime, iter_json_array
+from HttpClient import get_client
+from RunLog import log
 
 
 class HourlyWeather(Entity):
@@ -15,9 +22,117 @@ class HourlyWeather(Entity):
     wind: float
 
 
+class HourlySeries(object):
+    """
+    Weather variables in arrays indexed by hour since the first hour (in hours since the epoch), NaN when missing
+    """
+    variables: Tuple[str, ...]
+    start: Optional[int]
+    capacity: int
+    values: Dict[str, array]
+
+    def __init__(self, variables: Iterable[str] = ('rain', 'sun', 'temperature', 'wind'), capacity: int = 24 * 10):
+        self.variables = tuple(variables)
+        self.start = None
+        self.capacity = capacity
+        self.values = {}
+
+    def __len__(self):
+        return len(next(iter(self.values.values()))) if self.values else 0
+
+    def set(self, variable: str, hour: int, value: Optional[float]):
+        if value is None:
+            return
+        if self.start is None:
+            self.start = hour
+            self.values = {name: array('d', [math.nan]) * self.capacity for name in self.variables}
+        elif hour < self.start:
+            grow = array('d', [math.nan]) * (self.start - hour)
+            for name in self.variables:
+                self.values[name][0:0] = grow
+            self.start = hour
+        ix = hour - self.start
+        series = self.values[variable]
+        if ix >= len(series):
+            grow = array('d', [math.nan]) * max(ix + 1 - len(series), self.capacity)
+            for name in self.variables:
+                self.values[name].extend(grow)
+        series[ix] = value
+
+    def get(self, variable: str, hour: int) -> float:
+        """Get a value, NaN when missing"""
+        if self.start is None or variable not in self.values:
+            return math.nan
+        ix = hour - self.start
+        series = self.values[variable]
+        return series[ix] if 0 <= ix < len(series) else math.nan
+
+    def trim(self, first_hour: int):
+        """Drop the hours before first_hour"""
+        if self.start is None or first_hour <= self.start:
+            return
+        drop = min(first_hour - self.start, len(self))
+        for name in self.variables:
+            del self.values[name][:drop]
+        self.start += drop
+
+    def hours(self) -> range:
+        return range(self.start, self.start + len(self)) if self.start is not None else range(0)
+
+    @classmethod
+    def combine(cls, sources: Dict[str, List['HourlySeries']]) -> 'HourlySeries':
+        """Merge several series, taking each variable from the first series (in priority order) which has a value for the hour"""
+        result = cls(sources.keys())
+        for variable, series_list in sources.items():
+            for series in series_list:
+                for hour in series.hours():
+                    value = series.get(variable, hour)
+                    if not math.isnan(value) and math.isnan(result.get(variable, hour)):
+                        result.set(variable, hour, value)
+        return result
+
+    def to_json(self) -> Dict[str, Any]:
+        return {'start': self.start, 'values': {name: [None if math.isnan(value) else value for value in series] for name, series in self.values.items()}}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> 'HourlySeries':
+        result = cls(data['values'].keys())
+        for name, values in data['values'].items():
+            for ix, value in enumerate(values):
+                result.set(name, data['start'] + ix, value)
+        return result
+
+    def merge_into(self, weather: Dict[str, HourlyWeather]):
+        """Add/update the hourly entities, converting every hour slot to its key once"""
+        if self.start is None:
+            return
+        columns = [(name, self.values[name]) for name in self.variables]
+        for ix in range(len(self)):
+            slot = [(name, series[ix]) for name, series in columns if not math.isnan(series[ix])]
+            if not slot:
+                continue
+            instant = dump_datetime(datetime.utcfromtimestamp((self.start + ix) * 3600))
+            hour_weather = weather.get(instant)
+            if not hour_weather:
+                hour_weather = weather[instant] = HourlyWeather()
+            hour_weather.__dict__.update(slot)
+
+
+def epoch_hour(val: Union[datetime, str, int, float]) -> int:
+    """Get the number of hours since the epoch for an instant (JS timestamps in ms are most common)"""
+    if isinstance(val, (int, float)):
+        return int((val if val < 10000000000 else val / 1000) // 3600)
+    return int((parse_datetime(val) - datetime(1970, 1, 1)).total_seconds() // 3600)
+
+
 class Config(Entity):
     location: str
     maxage_hours: int
+    providers: Optional[List[str]]
+    priority: Optional[Dict[str, List[str]]]
+    timeout_seconds: Optional[float]
+    rain_gauge: Optional[str]
+    cache_file: Optional[str]
 
 
 def get_weather_point(farmware: Farmware) -> Point:
@@ -50,13 +165,17 @@ class Weather(Farmware[Config]):
         point = get_weather_point(self)
         weather = deserialize(Dict[str, HourlyWeather], point.meta)
         self.update_weather(weather)
-        limit = dump_datetime(datetime.utcnow() - timedelta(hours=(self.config.maxage_hours or 96) + 1))  # The dates are in a sortable format
+        limit = dump_datetime(self.retention_limit())  # The dates are in a sortable format
         for key in [key for key in weather if key <= limit]:  # clone keys since we're going to remove items
             del weather[key]
         point.meta = weather
-        app.log(f"Storing {len(weather)} hourly weather records...")
+        log(f"Storing {len(weather)} hourly weather records...")
         self.put_point(point)
 
+    def retention_limit(self) -> datetime:
+        """Weather records up to this instant are dropped"""
+        return datetime.utcnow() - timedelta(hours=(self.config.maxage_hours or 96) + 1)
+
     @abstractmethod
     def update_weather(self, weather):
         """
@@ -65,29 +184,157 @@ class Weather(Farmware[Config]):
         pass
 
 
-class MeteoswissWeather(Weather):
-    def update_weather(self, weather):
+class WeatherProvider(object):
+    """
+    A source of hourly weather data, configured from the weather farmware config
+    """
+    name: str = None
+    config: Config
+
+    def __init__(self, config: Config):
+        self.config = config
+
+    @abstractmethod
+    def fetch(self) -> HourlySeries:
+        pass
+
+
+__providers: Dict[str, Type[WeatherProvider]] = {}
+
+
+def weather_provider(cls: Type[WeatherProvider]) -> Type[WeatherProvider]:
+    """Class decorator registering a weather provider under its name"""
+    __providers[cls.name] = cls
+    return cls
+
+
+def get_weather_provider(name: str) -> Type[WeatherProvider]:
+    try:
+        return __providers[name.lower()]
+    except KeyError:
+        raise ValueError(f"Weather provider '{name}' not found, available: {', '.join(__providers)}")
+
+
+@weather_provider
+class MeteoswissProvider(WeatherProvider):
+    """Forecast of MeteoSwiss for a Swiss ZIP code"""
+    name = 'meteoswiss'
+
+    def fetch(self) -> HourlySeries:
         zip = int(self.config.location)
         if not (1000 <= zip <= 9999):
             raise ValueError("Invalid Swiss ZIP code")
         date = datetime.utcnow()
-        app.log(f"Fetching weather data...")
+        log(f"Fetching weather data...")
+        client = get_client()
         for ix in range(60):
             url = f"https://www.meteoschweiz.admin.ch/product/output/forecast-chart/version__{(date - timedelta(minutes=ix)).strftime('%Y%m%d_%H%M')}/de/{zip}00.json"
-            response = requests.get(url)
+            response = client.get(url, stream=True, timeout=(client.connect_timeout, self.config.timeout_seconds or client.read_timeout))
             if response.status_code != 404:
                 break
+            response.close()
         else:
             raise ValueError("No JSON data found within an hour")
         response.raise_for_status()
-        data = response.json()
-        for key, instant, value in itertools.chain(
-                (('rain', dump_datetime(parse_datetime(hour[0])), hour[1]) for day in data for hour in day['rainfall']),
-                (('sun', dump_datetime(parse_datetime(hour[0])), hour[1] / 100) for day in data for hour in day['sunshine']),
-                (('temperature', dump_datetime(parse_datetime(hour[0])), hour[1]) for day in data for hour in day['temperature']),
-                (('wind', dump_datetime(parse_datetime(hour[0])), hour[1]) for day in data for hour in day['wind']['data'])):
-            hour_weather = weather.get(instant)
-            if not hour_weather:
-                hour_weather = HourlyWeather()
-                weather[instant] = hour_weather
-            setattr(hour_weather, key, value)
+        series = HourlySeries()
+        with response:
+            for day in iter_json_array(response.iter_content(chunk_size=16384)):
+                for key, hours, scale in (('rain', day['rainfall'], 1), ('sun', day['sunshine'], 100), ('temperature', day['temperature'], 1), ('wind', day['wind']['data'], 1)):
+                    for hour in hours:
+                        series.set(key, epoch_hour(hour[0]), hour[1] / scale if hour[1] is not None else None)
+        return series
+
+
+@weather_provider
+class RainGaugeProvider(WeatherProvider):
+    """
+    Local readings from a CSV file or serial log with the columns "time,rain[,temperature,...]"; rain is summed per hour, other variables are averaged
+    """
+    name = 'raingauge'
+
+    def fetch(self) -> HourlySeries:
+        if not self.config.rain_gauge:
+            raise ValueError("No rain gauge file configured")
+        sums: Dict[Tuple[str, int], List[float]] = {}
+        with open(self.config.rain_gauge, newline='') as file:
+            reader = csv.reader(file)
+            columns = ['time', 'rain']
+            for row in reader:
+                if not row or row[0].startswith('#'):
+                    continue
+                if row[0].strip().lower() == 'time':
+                    columns = [column.strip().lower() for column in row]
+                    continue
+                try:
+                    hour = epoch_hour(float(row[0]) if row[0].strip().replace('.', '', 1).isdigit() else row[0].strip())
+                except (TypeError, ValueError):
+                    continue  # partial line of a serial log
+                for column, value in zip(columns[1:], row[1:]):
+                    try:
+                        number = float(value)
+                    except ValueError:
+                        continue  # empty or partial value
+                    if not math.isnan(number):
+                        sums.setdefault((column, hour), []).append(number)
+        series = HourlySeries({column for column, _ in sums} or ('rain',))
+        for (column, hour), values in sums.items():
+            series.set(column, hour, sum(values) if column == 'rain' else sum(values) / len(values))
+        return series
+
+
+@weather_provider
+class CacheProvider(WeatherProvider):
+    """The last merged series written by a previous run, used as fallback"""
+    name = 'cache'
+
+    def fetch(self) -> HourlySeries:
+        if not self.config.cache_file or not os.path.exists(self.config.cache_file):
+            return HourlySeries()
+        with open(self.config.cache_file) as file:
+            return HourlySeries.from_json(json.load(file))
+
+
+class MultiSourceWeather(Weather):
+    """
+    Fetch all configured providers concurrently and merge them with a per-variable priority
+    """
+
+    def update_weather(self, weather):
+        names = [name.lower() for name in (self.config.providers or ['meteoswiss', 'raingauge', 'cache'])]
+        providers = [get_weather_provider(name)(self.config) for name in names]
+        fetched: Dict[str, HourlySeries] = {}
+
+        def fetch(provider: WeatherProvider):
+            try:
+                fetched[provider.name] = provider.fetch()
+            except Exception as ex:
+                log(f"Weather provider {provider.name} failed: {str(ex)}", 'warn')
+
+        # daemon threads, so that a provider which hangs (e.g. on a serial device) does not keep the process alive
+        threads = [threading.Thread(target=fetch, args=(provider,), name=f"weather-{provider.name}", daemon=True) for provider in providers]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + (self.config.timeout_seconds or 30)
+        results: Dict[str, HourlySeries] = {}
+        for provider, thread in zip(providers, threads):
+            thread.join(max(deadline - time.monotonic(), 0))
+            if thread.is_alive():
+                log(f"Weather provider {provider.name} timed out", 'warn')
+            elif provider.name in fetched:
+                results[provider.name] = fetched[provider.name]
+        if not results:
+            raise ValueError("No weather provider returned data")
+        priority = {key.lower(): value for key, value in (self.config.priority or {}).items()}
+        variables = {variable for series in results.values() for variable in series.values}
+        series = HourlySeries.combine({variable: [results[name] for name in (priority.get(variable) or names) if name in results] for variable in sorted(variables)})
+        if self.config.cache_file:
+            # the cache provider reads the series back, so it would grow with every run without trimming
+            series.trim(epoch_hour(self.retention_limit()) + 1)
+            with open(self.config.cache_file, 'w') as file:
+                json.dump(series.to_json(), file)
+        series.merge_into(weather)
+
+
+class MeteoswissWeather(Weather):
+    def update_weather(self, weather):
+        MeteoswissProvider(self.config).fetch().merge_into(weather)
@@ -0,0 +1,66 @@
+"""
+Micro benchmarks for hot helper functions, run with `python benchmark.py`
+"""
+import os
+import tempfile
+import timeit
+from datetime import *
+from typing import *
+
+import utils
+
+
+def _report(name: str, count: int, seconds: float):
+    print(f"{name:<40} {count:>8} items {seconds * 1000:>10.1f} ms {seconds / count * 1000000:>8.2f} us/item")
+
+
+def bench_datetime(count: int = 100000):
+    """Compare the ISO fast path against the strptime/strftime reference implementation"""
+    start = datetime(2019, 1, 1)
+    instants = [start + timedelta(minutes=ix, milliseconds=ix % 1000) for ix in range(count)]
+    texts = utils.dump_datetimes(instants)
+    assert utils.parse_datetimes(texts) == instants
+    assert texts == [val.strftime("%Y-%m-%dT%H:%M:%S.%f")[:23] + 'Z' for val in instants]
+    _report('strptime (reference)', count, timeit.timeit(lambda: [datetime.strptime(val, "%Y-%m-%dT%H:%M:%S.%fZ") for val in texts], number=1))
+    _report('parse_datetime', count, timeit.timeit(lambda: [utils.parse_datetime(val) for val in texts], number=1))
+    _report('parse_datetimes', count, timeit.timeit(lambda: utils.parse_datetimes(texts), number=1))
+    _report('strftime (reference)', count, timeit.timeit(lambda: [val.strftime("%Y-%m-%dT%H:%M:%S.%f")[:23] + 'Z' for val in instants], number=1))
+    _report('dump_datetimes', count, timeit.timeit(lambda: utils.dump_datetimes(instants), number=1))
+    offsets = ['3 days ago', 'in 2 hours', 'now'] * (count // 3)
+    _report('parse_offset (memoized)', len(offsets), timeit.timeit(lambda: [utils.parse_offset(val) for val in offsets], number=1))
+
+
+class _Sample(utils.Entity):
+    id: int
+    name: str
+    created_at: datetime
+    meta: Dict[str, Any]
+    x: int
+    y: int
+    z: int
+
+
+def _reset_schema():
+    """Forget the resolved hints so that the next warm_up starts from scratch"""
+    utils._entity_hints.clear()
+    utils._entity_fields.clear()
+
+
+def bench_entities(count: int = 100000):
+    """Entity instantiation and factory warm-up (cold start resolves the schema, warm start loads the pickled one)"""
+    classes = len(utils._entity_classes())
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'entity_schema.pickle')
+        _reset_schema()
+        _report('warm_up (cold, writes schema)', classes, timeit.timeit(lambda: utils.warm_up(path), number=1))
+        _reset_schema()
+        _report('warm_up (cached schema)', classes, timeit.timeit(lambda: utils.warm_up(path), number=1))
+    _report('Entity()', count, timeit.timeit(lambda: [_Sample() for _ in range(count)], number=1))
+    make = utils.get_factory(_Sample)
+    data = {'id': 1, 'name': 'Carrot', 'created_at': '2019-01-01T00:00:00.000Z', 'meta': {}, 'x': 1, 'y': 2, 'z': 0}
+    _report('factory make', count, timeit.timeit(lambda: [make(dict(data)) for _ in range(count)], number=1))
+
+
+if __name__ == '__main__':
+    bench_datetime()
+    bench_entities()
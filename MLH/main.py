@@ -1,32 +1,78 @@
+import os
 import sys
 import traceback
 
-import requests
 from typing import *
-from farmware_tools import device
-from Farmbot import Farmware
-from MLH import MLH
-from Weather import MeteoswissWeather
+import Daemon
 
-if __name__ == '__main__':
 
-    device.log(f'Args: {str(sys.argv)}', 'debug')
+def run(argv: List[str]) -> int:
+    """Execute a farmware run in this process and return the exit code"""
+    import requests
+    from RunLog import configure, log, flush
+    from Farmbot import Farmware
+    from MLH import MLH
+    from Weather import MeteoswissWeather, MultiSourceWeather
+    from Layout import Layout
+    from HttpClient import get_client
+    from utils import warm_up
+    import Metrics
+
+    configure()
+    warm_up()
+    log(f'Args: {str(argv)}', 'debug')
     try:
-        app_name = None if len(sys.argv) < 2 else sys.argv[1].lower()
-        manifest_name = None if len(sys.argv) < 3 else sys.argv[2].lower()
+        app_name = None if len(argv) < 2 else argv[1].lower()
+        manifest_name = None if len(argv) < 3 else argv[2].lower()
         app: Optional[Farmware] = None
         if app_name == 'meteoswissweather':
             app = MeteoswissWeather(manifest_name)
+        elif app_name == 'weather':
+            app = MultiSourceWeather(manifest_name)
         elif app_name == 'mlh':
             app = MLH(manifest_name)
+        elif app_name == 'layout':
+            app = Layout(manifest_name)
         if not app:
-            device.log(f'Farmware not found: {str(app_name)}', 'error')
-            sys.exit(2)
-        app.execute()
-        sys.exit(0)
+            log(f'Farmware not found: {str(app_name)}', 'error')
+            return 2
+        Metrics.start(app.app_name, app.debug)
+        success = False
+        try:
+            app.execute()
+            success = True
+        finally:
+            client = get_client()
+            summary = client.summary()
+            latencies = [seconds for host in client.metrics.values() for seconds in host.latencies]
+            client.metrics.clear()
+            try:
+                Metrics.finish(success, latencies, app.simulator)
+            except Exception as ex:
+                log(f'Could not store run metrics: {str(ex)}', 'warn')
+            if summary:
+                log(f'HTTP summary:\n{summary}', 'debug')
+            if app.simulator:
+                log(app.simulator.summary(), 'info')
+            flush()
+        return 0
 
     except requests.exceptions.HTTPError as error:
-        device.log(f'HTTP error {error.response.status_code} {error.response.text[0:100]} ', 'error')
+        log(f'HTTP error {error.response.status_code} {error.response.text[0:100]} ', 'error')
     except Exception as ex:
-        device.log(f"Something went wrong: {''.join(traceback.format_exception(etype=type(ex), value=ex, tb=ex.__traceback__))}", 'error')
-    sys.exit(1)
+        log(f"Something went wrong: {''.join(traceback.format_exception(etype=type(ex), value=ex, tb=ex.__traceback__))}", 'error')
+    return 1
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1].lower() == 'report':
+        import Metrics
+        print(Metrics.report(sys.argv[2] if len(sys.argv) >= 3 else None, int(sys.argv[3]) if len(sys.argv) >= 4 else 30))
+        sys.exit(0)
+    if len(sys.argv) >= 2 and sys.argv[1].lower() == 'daemon':
+        Daemon.serve(run)
+        sys.exit(0)
+    exit_code = Daemon.forward(sys.argv, dict(os.environ))
+    if exit_code is None:
+        exit_code = run(sys.argv)
+    sys.exit(exit_code)
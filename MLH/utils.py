@@ -1,5 +1,11 @@
 import ast
+import codecs
+import hashlib
 import json
+import os
+import pickle
+import sys
+from functools import lru_cache
 from typing import *
 from datetime import *
 import re
@@ -7,11 +13,14 @@ import re
 # timezone
 tz = 0
 
+__rxspace = re.compile('\\s+')
 
+
+@lru_cache(maxsize=256)
 def parse_offset(offset: Optional[str], days: bool = False) -> Optional[timedelta]:
-    """Parse a date offset, such as "in x days" or "x days ago" """
+    """Parse a date offset, such as "in x days" or "x days ago" (memoized, the result is relative)"""
     if offset:
-        offset = re.sub('\\s+', ' ', offset.strip().lower())
+        offset = __rxspace.sub(' ', offset.strip().lower())
         if days:
             if offset == 'today':
                 return timedelta()
@@ -32,6 +41,16 @@ def parse_offset(offset: Optional[str], days: bool = False) -> Optional[timedelt
             return timedelta(**{match.group(2) + 's': -int(match.group(1))})
 
 
+def _parse_iso_datetime(val: str) -> Optional[datetime]:
+    """Fast path for the fixed ISO layout "YYYY-MM-DDThh:mm:ss.fffZ", returns None if the layout does not match"""
+    if len(val) == 24 and val[23] == 'Z' and val[10] == 'T' and val[19] == '.' and val[4] == '-' and val[7] == '-' and val[13] == ':' and val[16] == ':':
+        try:
+            return datetime(int(val[0:4]), int(val[5:7]), int(val[8:10]), int(val[11:13]), int(val[14:16]), int(val[17:19]), int(val[20:23]) * 1000)
+        except ValueError:
+            return None
+    return None
+
+
 def parse_datetime(val: Union[datetime, str, int, float, None], default: Optional[datetime] = None) -> Optional[datetime]:
     """Parse an ISO datetime ("YYYY-MM-DDThh:mm:ss.fffZ") in UTC. May be an offset relative to datetime.utcnow (see parse_offset)."""
     if not val:
@@ -40,12 +59,30 @@ def parse_datetime(val: Union[datetime, str, int, float, None], default: Optiona
         return val
     if isinstance(val, int) or isinstance(val, float):  # unix or JS timestamp
         return datetime.utcfromtimestamp(val if val < 10000000000 else val / 1000)
+    result = _parse_iso_datetime(val)
+    if result:
+        return result
     offset = parse_offset(val, False)
     if offset:
         return datetime.utcnow() + offset
     return datetime.strptime(val.strip(), "%Y-%m-%dT%H:%M:%S.%fZ")
 
 
+def parse_datetimes(values: Iterable[Union[datetime, str, int, float, None]], default: Optional[datetime] = None) -> List[Optional[datetime]]:
+    """Parse many datetimes at once (see parse_datetime)"""
+    parse_iso = _parse_iso_datetime
+    result: List[Optional[datetime]] = []
+    append = result.append
+    for val in values:
+        if val.__class__ is str:
+            parsed = parse_iso(val)
+            if parsed:
+                append(parsed)
+                continue
+        append(parse_datetime(val, default))
+    return result
+
+
 def parse_date(val: Union[date, str, int, float, None], default: Optional[date] = None) -> Optional[date]:
     """Parse a ISO date ("YYYY-MM-DD") in UTC. May be an offset relative to datetime.utcnow (see parse_offset)."""
     if not val:
@@ -63,7 +100,14 @@ def parse_date(val: Union[date, str, int, float, None], default: Optional[date]
 def dump_datetime(val: Optional[datetime]) -> Optional[str]:
     """Dump an instant as ISO string ("YYYY-MM-DDThh:mm:ss.fffZ")"""
     if val:
-        return val.strftime("%Y-%m-%dT%H:%M:%S.%f")[:23] + 'Z'
+        if val.tzinfo is not None:
+            val = val.replace(tzinfo=None)
+        return val.isoformat(timespec='milliseconds') + 'Z'
+
+
+def dump_datetimes(values: Iterable[Optional[datetime]]) -> List[Optional[str]]:
+    """Dump many instants at once (see dump_datetime)"""
+    return [dump_datetime(val) for val in values]
 
 
 def dump_date(val: Optional[date]) -> Optional[str]:
@@ -92,6 +136,41 @@ def local_now() -> datetime:
     return utc_to_local(utc_now())
 
 
+def iter_json_array(chunks: Iterable[Union[bytes, str]]) -> Iterator[Any]:
+    """Incrementally decode the items of a top-level JSON array, so that only one item needs to be held in memory"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buffer = buffer[pos:] + (utf8.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ','):
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Expected a JSON array')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # incomplete item, wait for more data
+            if end == len(buffer):
+                break  # a number may continue in the next chunk
+            pos = end
+            yield item
+    if buffer[pos:].strip():
+        raise ValueError('Truncated JSON array')
+
+
 TAny = TypeVar("TAny")
 
 
@@ -111,8 +190,10 @@ class Entity(object):
         self = super().__new__(cls)
         if __dict__:
             self.__dict__ = __dict__
-        for key in get_factory(cls).__self__.get_props():
-            self.__dict__.setdefault(key)
+        data = self.__dict__
+        for key in _entity_fields.get(cls) or get_entity_fields(cls):
+            if key not in data:
+                data[key] = None
         return self
 
     def __init__(self, __dict__: Dict[str, Any] = None, *args, **kwargs):
@@ -133,6 +214,76 @@ class Entity(object):
 
 TEntity = TypeVar("TEntity", bound=Entity)
 
+# resolved type hints and field names per entity class
+_entity_hints: Dict[type, Dict[str, Any]] = {}
+_entity_fields: Dict[type, Tuple[str, ...]] = {}
+
+SCHEMA_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'entity_schema.pickle')
+
+
+def get_entity_hints(cls: type) -> Dict[str, Any]:
+    hints = _entity_hints.get(cls)
+    if hints is None:
+        hints = _entity_hints[cls] = get_type_hints(cls)
+    return hints
+
+
+def get_entity_fields(cls: type) -> Tuple[str, ...]:
+    fields = _entity_fields.get(cls)
+    if fields is None:
+        fields = _entity_fields[cls] = tuple(get_entity_hints(cls))
+    return fields
+
+
+def _entity_classes() -> List[type]:
+    result: List[type] = []
+    queue = [Entity]
+    while queue:
+        for child in queue.pop().__subclasses__():
+            if child not in result:
+                result.append(child)
+                queue.append(child)
+    return result
+
+
+def warm_up(path: Optional[str] = SCHEMA_CACHE_PATH) -> int:
+    """
+    Resolve the type hints and factories of all loaded entity classes. The hints are loaded from a pickled schema
+    when it matches the hash of the defining source files, and the schema is rewritten otherwise.
+    :returns The number of entity classes
+    """
+    classes = _entity_classes()
+    digest = hashlib.sha1()
+    for name in sorted({cls.__module__ for cls in classes}):
+        source = getattr(sys.modules.get(name), '__file__', None)
+        if source:
+            with open(source, 'rb') as file:
+                digest.update(file.read())
+    digest = digest.hexdigest()
+    schema: Optional[Dict[str, Any]] = None
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'rb') as file:
+                schema = pickle.load(file)
+        except Exception:
+            schema = None
+    if schema and schema.get('hash') == digest:
+        for cls in classes:
+            hints = schema['hints'].get((cls.__module__, cls.__qualname__))
+            if hints is not None:
+                _entity_hints.setdefault(cls, hints)
+    elif path:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                pickle.dump({'hash': digest, 'hints': {(cls.__module__, cls.__qualname__): get_entity_hints(cls) for cls in classes}}, file)
+        except Exception:
+            pass  # read-only installation, resolve at runtime
+    for cls in classes:
+        get_factory(cls).__self__.get_props()
+        get_entity_fields(cls)
+    return len(classes)
+
 factories: Dict[type, Callable[[Any], Any]] = {
     Any: lambda val: val,
     bool: lambda val: bool(ast.literal_eval(val) if isinstance(val, str) else val),
@@ -156,7 +307,7 @@ class EntityFactory(Generic[TEntity]):
 
     def get_props(self):
         if not self.props:
-            self.props = {item[0]: get_factory(item[1]) for item in get_type_hints(self.cls).items()}
+            self.props = {item[0]: get_factory(item[1]) for item in get_entity_hints(self.cls).items()}
         return self.props
 
     def make(self, data: Dict[str, Any]) -> TEntity:
@@ -0,0 +1,142 @@
+"""
+Coordinator tests with simulated bot stand-ins; farmware_tools is replaced by an in-memory double when it is not installed
+"""
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MLH'))
+
+
+class FakeBot(object):
+    """Records the moves it receives, each move takes a short real time"""
+
+    def __init__(self, move_seconds: float = 0.02):
+        self.position = {'x': 0, 'y': 0, 'z': 0}
+        self.moves = []
+        self.threads = set()
+        self.move_seconds = move_seconds
+
+    def log(self, message, message_type='info'):
+        pass
+
+    def assemble_coordinate(self, x, y, z):
+        return {'x': x, 'y': y, 'z': z}
+
+    def get_bot_state(self):
+        return {'location_data': {'position': dict(self.position)}, 'informational_settings': {'sync_status': 'synced'}, 'pins': {},
+                'configuration': {}, 'user_env': {}, 'jobs': {}, 'process_info': {'farmwares': {}}}
+
+    def move_absolute(self, location, speed, offset):
+        self.threads.add(threading.get_ident())
+        time.sleep(self.move_seconds)
+        self.position = {key: location[key] + offset[key] for key in location}
+        self.moves.append(dict(self.position))
+
+    def move_relative(self, x, y, z, speed):
+        self.position['z'] += z
+
+    def execute(self, sequence_id):
+        pass
+
+    def sync(self):
+        pass
+
+
+class FakeApp(object):
+    def get(self, endpoint):
+        if endpoint == 'device':
+            return {'serial_number': 'LOCAL', 'tz_offset_hrs': 0}
+        if endpoint in ('sequences', 'tools', 'points'):
+            return []
+        raise KeyError(endpoint)
+
+
+try:
+    import farmware_tools
+except ImportError:
+    farmware_tools = types.ModuleType('farmware_tools')
+    farmware_tools.device = FakeBot()
+    farmware_tools.app = FakeApp()
+    sys.modules['farmware_tools'] = farmware_tools
+
+import Coordinator
+from Farmbot import Farmware, Plant
+
+
+class FakeFarmware(Farmware):
+    def __init__(self, device):
+        self.debug = False
+        self.device = device
+        self.simulator = None
+        self._snapshot = None
+
+    def execute(self):
+        pass
+
+
+def loop(farmware, plants, done):
+    for plant in farmware.sort_moves(plants):
+        farmware.moveto_smart(plant, travel_height=None)
+        done(plant)
+
+
+@unittest.skipIf(getattr(farmware_tools, '__file__', None), 'requires the farmware_tools double')
+class CoordinatorTest(unittest.TestCase):
+    regions = {'LOCAL': [0, 0, 1499, 1000], 'S2': [1500, 0, 3000, 1000]}
+
+    def setUp(self):
+        self.local = farmware_tools.device
+        self.local.moves.clear()
+        self.other = FakeBot()
+        Coordinator.register_bot('S2', self.other)
+        self.plants = [Plant(id=ix, x=x, y=y, meta={}) for ix, (x, y) in enumerate((x, y) for x in range(0, 3000, 300) for y in (100, 500))]
+
+    def tearDown(self):
+        Coordinator.unregister_bot('S2')
+
+    def test_partition_by_region_and_meta(self):
+        self.plants[0].meta['bot'] = 'S2'
+        partitions = Coordinator.partition(self.plants, self.regions, 'bot')
+        self.assertIn(self.plants[0], partitions['S2'])
+        self.assertTrue(all(plant.x >= 1500 for plant in partitions['S2'][1:]))
+        self.assertEqual(len(self.plants), sum(len(plants) for plants in partitions.values()))
+
+    def test_runs_bots_concurrently_and_merges_centrally(self):
+        done = []
+        caller = threading.get_ident()
+        started = time.monotonic()
+        reports = Coordinator.run_partitions(FakeFarmware(self.local), Coordinator.partition(self.plants, self.regions), loop,
+                                             lambda plant: done.append((plant, threading.get_ident())))
+        elapsed = time.monotonic() - started
+        self.assertEqual(sorted(plant.id for plant, _ in done), [plant.id for plant in self.plants])
+        self.assertTrue(all(thread == caller for _, thread in done))
+        self.assertEqual({report.serial_number: report.completed for report in reports}, {'LOCAL': 10, 'S2': 10})
+        self.assertEqual(10, len(self.local.moves))
+        self.assertEqual(10, len(self.other.moves))
+        self.assertTrue(all(move['x'] >= 1500 for move in self.other.moves))
+        self.assertLess(elapsed, 20 * self.other.move_seconds)  # serial execution would take at least 20 moves
+
+    def test_missing_bot_fails_before_moving(self):
+        regions = dict(self.regions, S3=[3001, 0, 4000, 1000])
+        partitions = Coordinator.partition(self.plants + [Plant(id=99, x=3500, y=100, meta={})], regions)
+        with self.assertRaises(ValueError):
+            Coordinator.run_partitions(FakeFarmware(self.local), partitions, loop, lambda plant: None)
+        self.assertEqual([], self.local.moves)
+        self.assertEqual([], self.other.moves)
+
+    def test_failing_bot_fails_the_run(self):
+        def failing(farmware, plants, done):
+            if farmware.device is self.other:
+                raise RuntimeError('motor stalled')
+            loop(farmware, plants, done)
+
+        with self.assertRaises(ValueError):
+            Coordinator.run_partitions(FakeFarmware(self.local), Coordinator.partition(self.plants, self.regions), failing, lambda plant: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
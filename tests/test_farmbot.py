@@ -0,0 +1,98 @@
+"""
+Farmware point storage and query tests; the web app requests are captured instead of sent
+"""
+import base64
+import json
+import os
+import threading
+import time
+import unittest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import requests
+
+from test_coordinator import FakeBot, FakeFarmware
+
+import Farmbot
+import HttpClient
+from Farmbot import Plant, PointQuery
+
+
+class PutPointTest(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+
+        def api_request(method, endpoint, id=None, payload=None):
+            payload = json.loads(json.dumps(payload))
+            self.requests.append((method, endpoint, id, payload))
+            # the web app returns the stored point with all its fields
+            return {**payload, 'id': id or 42, 'device_id': 1, 'created_at': '2019-05-01T00:00:00.000Z', 'updated_at': '2019-05-02T00:00:00.000Z'}
+
+        patcher = mock.patch.object(Farmbot, '_api_request', api_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_update_plant(self):
+        plant = Plant(id=7, pointer_type='Plant', name='Carrot', openfarm_slug='carrot', plant_stage='planted', x=10, y=20, z=0, meta={'watered': 'yes'}, planted_at=datetime(2019, 5, 1))
+        result = FakeFarmware(FakeBot()).put_point(plant)
+        method, endpoint, id, payload = self.requests[0]
+        self.assertEqual(('PUT', 'points', 7), (method, endpoint, id))
+        self.assertEqual('2019-05-01T00:00:00.000Z', payload['planted_at'])
+        self.assertEqual({'watered': 'yes'}, result.meta)
+
+    def test_create_plant(self):
+        result = FakeFarmware(FakeBot()).put_point(Plant(pointer_type='Plant', name='Carrot', openfarm_slug='carrot', plant_stage='planned', x=10, y=20, z=0))
+        self.assertEqual(('POST', 'points', None), self.requests[0][:3])
+        self.assertEqual(42, result.id)
+
+
+class _SlowWebApp(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.received.append(self.path)
+        time.sleep(0.3)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SendPointTest(unittest.TestCase):
+    def test_create_not_repeated_on_timeout(self):
+        server = HTTPServer(('127.0.0.1', 0), _SlowWebApp)
+        server.received = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        claims = base64.urlsafe_b64encode(json.dumps({'iss': f'//127.0.0.1:{server.server_port}'}).encode()).decode().rstrip('=')
+        client = HttpClient.HttpClient(read_timeout=0.1, backoff=0)
+        with mock.patch.dict(os.environ, {'FARMBOT_API_TOKEN': f'header.{claims}.signature'}), mock.patch.object(HttpClient, 'get_client', lambda: client):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                FakeFarmware(FakeBot()).send_point({'pointer_type': 'Plant', 'x': 10, 'y': 20})
+        self.assertEqual(['/api/points'], server.received)
+
+
+class PointQueryTest(unittest.TestCase):
+    def plants(self):
+        return [Plant(id=1, pointer_type='Plant', plant_stage='planted', planted_at=datetime(2019, 5, 1), meta={'water_ml': '10'}),
+                Plant(id=2, pointer_type='Plant', plant_stage='planned', planted_at=None, meta={}),
+                Plant(id=3, pointer_type='Plant', plant_stage='planted', planted_at=datetime(2019, 5, 1), meta={'water_ml': 'lots'})]
+
+    def matches(self, query):
+        query = PointQuery(Plant, query)
+        return [plant.id for plant in self.plants() if all(predicate(plant) for predicate in query.predicates)]
+
+    def test_date_without_value(self):
+        self.assertEqual([1, 3], self.matches({'planted_at': 'before 3 days ago'}))
+        self.assertEqual([2], self.matches({'!planted_at': 'before 3 days ago'}))
+
+    def test_number_without_value(self):
+        self.assertEqual([1], self.matches({'water_ml': 'at least 5'}))
+        self.assertEqual([2, 3], self.matches({'!water_ml': 'at least 5'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
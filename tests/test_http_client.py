@@ -0,0 +1,67 @@
+"""
+HttpClient retry tests against a local HTTP server
+"""
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MLH'))
+
+from HttpClient import HttpClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.received.append(self.command)
+        if self.path == '/slow':
+            time.sleep(0.3)
+        self.send_response(500 if self.path == '/error' else 200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.received = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.client = HttpClient(read_timeout=0.1, retries=2, backoff=0)
+
+    def test_get_retried(self):
+        self.assertEqual(500, self.client.get(self.url + '/error').status_code)
+        self.assertEqual(3, len(self.server.received))
+
+    def test_post_not_retried_after_sending(self):
+        self.assertEqual(500, self.client.post(self.url + '/error', {}).status_code)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client.post(self.url + '/slow', {})
+        self.assertEqual(2, len(self.server.received))
+
+    def test_post_retried_when_not_connected(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.post(f'http://127.0.0.1:{port}/', {})
+        self.assertEqual(2, self.client.metrics[f'http://127.0.0.1:{port}'].retries)
+
+
+if __name__ == '__main__':
+    unittest.main()
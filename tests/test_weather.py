@@ -0,0 +1,69 @@
+"""
+Weather series and provider tests
+"""
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import test_coordinator  # noqa: F401, installs the farmware_tools double when needed
+
+import Weather
+from Weather import HourlySeries, epoch_hour
+
+
+class HourlySeriesTest(unittest.TestCase):
+    def test_trim(self):
+        series = HourlySeries(('rain',))
+        for hour in range(100, 110):
+            series.set('rain', hour, hour)
+        series.trim(105)
+        self.assertEqual(105, series.start)
+        self.assertEqual(105.0, series.get('rain', 105))
+        self.assertEqual(109.0, series.get('rain', 109))
+        series.trim(1000)
+        self.assertEqual(0, len(series))
+
+
+class RainGaugeProviderTest(unittest.TestCase):
+    def test_malformed_values_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'gauge.csv')
+            with open(path, 'w') as file:
+                file.write('time,rain,temperature\n'
+                           '2019-05-01T10:00:00.000Z,0.5,12.5\n'
+                           '2019-05-01T10:20:00.000Z,0.2,1x\n'
+                           '2019-05-01T10:40:00.000Z,0.\n'
+                           '2019-05-01T10:50:00.000Z,,13.5\n'
+                           '2019-05-01T11')
+            with mock.patch.dict(os.environ, {'weather_rain_gauge': path, 'weather_maxage_hours': '48'}):
+                series = Weather.RainGaugeProvider(Weather.MultiSourceWeather('weather').config).fetch()
+        hour = epoch_hour('2019-05-01T10:00:00.000Z')
+        self.assertAlmostEqual(0.7, series.get('rain', hour))
+        self.assertAlmostEqual(13.0, series.get('temperature', hour))
+
+
+class MultiSourceWeatherTest(unittest.TestCase):
+    def test_cache_file_trimmed(self):
+        now = epoch_hour(datetime.utcnow())
+        old = HourlySeries(('rain',))
+        for hour in range(now - 24 * 30, now):
+            old.set('rain', hour, 1.0)
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = os.path.join(directory, 'weather.json')
+            with open(cache_file, 'w') as file:
+                json.dump(old.to_json(), file)
+            with mock.patch.dict(os.environ, {'weather_providers': "['cache']", 'weather_cache_file': cache_file, 'weather_maxage_hours': '48'}):
+                farmware = Weather.MultiSourceWeather('weather')
+            weather = {}
+            farmware.update_weather(weather)
+            with open(cache_file) as file:
+                cached = HourlySeries.from_json(json.load(file))
+        self.assertEqual(epoch_hour(datetime.utcnow() - timedelta(hours=49)) + 1, cached.start)
+        self.assertTrue(weather)
+
+
+if __name__ == '__main__':
+    unittest.main()